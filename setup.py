@@ -23,15 +23,19 @@ install_requires = [
     "django",
     "numpy",
     "psycopg2-binary",
-    "shapely",
+    "shapely>=2",
     "click",
     "attrs",
     "Markdown",
     "munch",
     "pysolar",
-    "pyproj",
+    "pyproj>=3.1",
 ]
 
+extras_require = {
+    "async": ["asyncpg"],
+}
+
 packages = find_packages()
 
 entry_points = {
@@ -51,6 +55,7 @@ setup(
     packages=packages,
     include_package_data=True,
     install_requires=install_requires,
+    extras_require=extras_require,
     classifiers=classifiers,
     entry_points=entry_points,
 )
@@ -0,0 +1,149 @@
+"""
+Asynchronous queries.
+
+An asyncio event loop runs in a background thread of the process and
+keeps a handful of asyncpg connections. Threads hand it lists of
+statements, which it runs concurrently over the connections, and wait for
+the rows while the loop multiplexes every statement in flight.
+
+asyncpg is optional, `available()` tells whether it can be used.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+
+def available():
+    return asyncpg is not None
+
+
+def connect_params(database):
+    """asyncpg.connect arguments for a Django DATABASES entry"""
+    params = dict(
+        database=database.get('NAME'),
+        user=database.get('USER'),
+        password=database.get('PASSWORD'),
+        host=database.get('HOST'),
+        port=database.get('PORT'),
+    )
+    return {k: v for k, v in params.items() if v not in (None, '')}
+
+
+def connect_databases(params):
+    """
+    returns a coroutine function opening the i-th connection on the
+    databases of params in turn
+    """
+
+    async def connect(i):
+        return await asyncpg.connect(**params[i % len(params)])
+
+    return connect
+
+
+class AsyncQueryEngine:
+    def __init__(self, connect, size):
+        """
+        connect -- a coroutine function of a connection number, returning
+                   a connection with asyncpg's `fetch` and `is_closed`
+        size    -- maximum number of connections
+        """
+        self._connect = connect
+        self.size = size
+        self._lock = threading.Lock()
+        self._loop = None
+        self._slots = None
+        self._idle = []
+        self._opened = 0
+        self._connects = 0
+        self.statements = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever,
+                                 name='solar-async-engine',
+                                 daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    async def _acquire(self):
+        # a slot per connection, whether idle, in use or to be opened, so
+        # that a closed connection frees its slot for a new one
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        await self._slots.acquire()
+        try:
+            while len(self._idle) > 0:
+                conn = self._idle.pop()
+                if not conn.is_closed():
+                    return conn
+                self._opened -= 1
+            # a replaced connection goes to the next database
+            n = self._connects
+            self._connects += 1
+            conn = await self._connect(n)
+            self._opened += 1
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn):
+        if conn.is_closed():
+            self._opened -= 1
+        else:
+            self._idle.append(conn)
+        self._slots.release()
+
+    async def _fetch(self, query, args):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            conn = await self._acquire()
+            try:
+                return await conn.fetch(query, *args)
+            finally:
+                self._release(conn)
+        finally:
+            self.in_flight -= 1
+            self.statements += 1
+
+    async def _fetch_all(self, query, args_list):
+        return await asyncio.gather(
+            *(self._fetch(query, args) for args in args_list))
+
+    def fetch_all(self, query, args_list, timeout=None):
+        """
+        Run query once for each tuple of arguments of args_list, all of
+        them in flight at once, and wait for their rows.
+
+        returns a list of lists of records, in the order of args_list
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._fetch_all(query, list(args_list)), self._start())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # statements left running would hold connections for nothing
+            future.cancel()
+            raise
+
+    def stats(self):
+        return dict(
+            connections=self._opened,
+            statements=self.statements,
+            max_in_flight=self.max_in_flight,
+        )
@@ -0,0 +1,146 @@
+"""
+Routing of queries among replicas of a database.
+
+The Balancer of a process counts, for each replica (a Django database
+alias), the queries in flight and a moving average of their latency, and
+picks the replica of the next query by policy:
+
+- "random" uniformly at random, as Data always did;
+- "least" the replica with the fewest queries in flight;
+- "ewma" the lowest expected wait, the latency average times the number
+  of queries in flight plus one, so that a slow or busy replica gets less
+  work but is still probed.
+
+A replica failing `eject_failures` queries in a row (lost connections,
+timeouts) is ejected for `eject_time` seconds, unless every replica is.
+"""
+
+import logging
+import random
+import threading
+from contextlib import contextmanager
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("random", "least", "ewma")
+# weight of a new latency in the moving average
+EWMA_WEIGHT = 0.2
+
+
+class ReplicaStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.latency = None
+        self.queries = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+
+class Balancer:
+    def __init__(self,
+                 policy="random",
+                 eject_failures=3,
+                 eject_time=30.0,
+                 failures=(Exception, )):
+        """
+        failures -- exception classes counted as failures of a replica
+        """
+        if policy not in POLICIES:
+            raise ValueError('Unknown routing policy "{}"'.format(policy))
+        self.policy = policy
+        self.eject_failures = eject_failures
+        self.eject_time = eject_time
+        self.failures = failures
+        self._lock = threading.Lock()
+        self._replicas = dict()
+
+    def _stats(self, alias):
+        stats = self._replicas.get(alias)
+        if stats is None:
+            stats = ReplicaStats()
+            self._replicas[alias] = stats
+        return stats
+
+    def _cost(self, stats):
+        if self.policy == "least":
+            return stats.in_flight
+        # replicas not measured yet go first
+        latency = stats.latency if stats.latency is not None else 0.0
+        return latency * (stats.in_flight + 1)
+
+    def choose(self, aliases):
+        """the alias to send the next query to"""
+        if len(aliases) == 1:
+            return aliases[0]
+        now = monotonic()
+        with self._lock:
+            candidates = [
+                a for a in aliases if self._stats(a).ejected_until <= now
+            ]
+            if len(candidates) == 0:
+                candidates = list(aliases)
+            if self.policy == "random":
+                return random.choice(candidates)
+            costs = [self._cost(self._stats(a)) for a in candidates]
+            best = min(costs)
+            return random.choice(
+                [a for a, c in zip(candidates, costs) if c == best])
+
+    @contextmanager
+    def track(self, alias):
+        """count a query in flight on alias for the duration of the block"""
+        with self._lock:
+            self._stats(alias).in_flight += 1
+        failed = False
+        try:
+            yield
+        except self.failures:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                stats = self._stats(alias)
+                stats.in_flight -= 1
+                stats.queries += 1
+                if failed:
+                    self._fail(alias, stats)
+                else:
+                    stats.consecutive_failures = 0
+
+    def _fail(self, alias, stats):
+        stats.failures += 1
+        stats.consecutive_failures += 1
+        if stats.consecutive_failures >= self.eject_failures:
+            stats.consecutive_failures = 0
+            stats.ejections += 1
+            stats.ejected_until = monotonic() + self.eject_time
+            logger.warning('Replica "{}" ejected for {} seconds'.format(
+                alias, self.eject_time))
+
+    def observe(self, alias, latency):
+        """record the latency, in seconds, of a query run on alias"""
+        with self._lock:
+            stats = self._stats(alias)
+            if stats.latency is None:
+                stats.latency = latency
+            else:
+                stats.latency += EWMA_WEIGHT * (latency - stats.latency)
+
+    def stats(self):
+        now = monotonic()
+        with self._lock:
+            return {
+                alias: dict(
+                    in_flight=s.in_flight,
+                    latency=round(s.latency, 4)
+                    if s.latency is not None else None,
+                    queries=s.queries,
+                    failures=s.failures,
+                    ejections=s.ejections,
+                    ejected=s.ejected_until > now,
+                )
+                for alias, s in self._replicas.items()
+            }
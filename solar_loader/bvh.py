@@ -0,0 +1,301 @@
+"""
+In-memory bounding volume hierarchy over triangulated solids.
+
+Solids are loaded once (per tile of the territory) and then queried
+locally for the ones hit by a triangle extruded towards the sun, which
+is what the `select_intersect` query does on the PostGIS side.
+"""
+
+import math
+import logging
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEAF_SIZE = 8
+
+
+# meters, faces closer than this to the prism are hits, as touching
+# geometries are for ST_3DIntersects
+EPSILON = 1e-6
+
+
+def prism_vertices(triangle, sunvec, near, far):
+    """returns the (6, 3) vertices of an extruded triangle"""
+    base = np.array([triangle.a, triangle.b, triangle.c], dtype=float)
+    return np.concatenate([base + sunvec * near, base + sunvec * far])
+
+
+def prism_hits(tris, triangle, sunvec, near, far):
+    """
+    Test triangles against the prism obtained by extruding `triangle`
+    along `sunvec` from `near` to `far` meters.
+
+    Both being convex, a triangle misses the prism if and only if their
+    projections are apart on one of: the normals of the faces of the
+    prism, the normal of the triangle, or the cross products of an edge
+    of the triangle with an edge of the prism. The test is exact, as
+    `ST_3DIntersects` in `select_intersect`.
+
+    tris     -- (m, 3, 3) array of triangles
+    triangle -- records.Triangle
+    sunvec   -- unit vector pointing towards the sun
+
+    returns a boolean mask of length m
+    """
+    m = len(tris)
+    if m == 0:
+        return np.zeros(0, dtype=bool)
+
+    prism = prism_vertices(triangle, sunvec, near, far)
+    base_edges = np.roll(prism[:3], -1, axis=0) - prism[:3]
+    prism_edges = np.concatenate([base_edges, [sunvec]])
+    prism_normals = np.concatenate([
+        [np.cross(base_edges[0], base_edges[1])],
+        np.cross(base_edges, sunvec),
+    ])
+
+    tris_edges = np.roll(tris, -1, axis=1) - tris
+    tris_normals = np.cross(tris_edges[:, 0], tris_edges[:, 1])
+    crossed = np.cross(tris_edges[:, :, None, :], prism_edges[None, None])
+
+    axes = np.concatenate([
+        np.broadcast_to(prism_normals, (m, 4, 3)),
+        tris_normals[:, None, :],
+        crossed.reshape(m, 12, 3),
+    ], axis=1)
+    # parallel edges give no axis
+    norms = np.linalg.norm(axes, axis=2, keepdims=True)
+    axes = np.divide(axes, norms, out=np.zeros_like(axes), where=norms > 1e-9)
+
+    prism_proj = np.einsum('pd,mkd->mkp', prism, axes)
+    tris_proj = np.einsum('mpd,mkd->mkp', tris, axes)
+    separated = np.any(
+        (prism_proj.max(axis=2) + EPSILON < tris_proj.min(axis=2))
+        | (tris_proj.max(axis=2) + EPSILON < prism_proj.min(axis=2)),
+        axis=1)
+
+    return ~separated
+
+
+def prism_bounds(triangle, sunvec, near, far):
+    """returns the axis aligned bounding box of an extruded triangle"""
+    pts = prism_vertices(triangle, sunvec, near, far)
+    return pts.min(axis=0), pts.max(axis=0)
+
+
+class SolidBVH:
+    """
+    A BVH over the faces of a set of solids.
+
+    Nodes are stored in flat arrays; a leaf covers the range
+    [start, start + count) of the reordered faces.
+    """
+
+    def __init__(self, solids, leaf_size=LEAF_SIZE):
+        """
+        solids -- an iterable of (id, (n, 3, 3) array of triangles)
+        """
+        self.ids = []
+        self.solids = []
+        chunks = []
+        owners = []
+        for id, tris in solids:
+            if len(tris) == 0:
+                continue
+            owners.append(np.full(len(tris), len(self.ids)))
+            chunks.append(np.asarray(tris, dtype=float))
+            self.ids.append(id)
+            self.solids.append(tris)
+
+        if len(chunks) > 0:
+            self.tris = np.concatenate(chunks)
+            self.owners = np.concatenate(owners)
+        else:
+            self.tris = np.zeros((0, 3, 3))
+            self.owners = np.zeros(0, dtype=int)
+
+        self.leaf_size = leaf_size
+        self._build()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build(self):
+        n = len(self.tris)
+        tri_lo = self.tris.min(axis=1)
+        tri_hi = self.tris.max(axis=1)
+        centers = (tri_lo + tri_hi) / 2.0
+        order = np.arange(n)
+
+        lo, hi, left, right, start, count = [], [], [], [], [], []
+
+        def new_node(s, e):
+            idx = order[s:e]
+            lo.append(tri_lo[idx].min(axis=0) if e > s else np.zeros(3))
+            hi.append(tri_hi[idx].max(axis=0) if e > s else np.zeros(3))
+            left.append(-1)
+            right.append(-1)
+            start.append(s)
+            count.append(e - s)
+            return len(lo) - 1
+
+        stack = [(new_node(0, n), 0, n)]
+        while len(stack) > 0:
+            node, s, e = stack.pop()
+            if e - s <= self.leaf_size:
+                continue
+            idx = order[s:e]
+            extent = centers[idx].max(axis=0) - centers[idx].min(axis=0)
+            axis = int(np.argmax(extent))
+            if extent[axis] <= 0:
+                continue
+            mid = s + (e - s) // 2
+            part = np.argpartition(centers[idx, axis], mid - s)
+            order[s:e] = idx[part]
+            left[node] = new_node(s, mid)
+            right[node] = new_node(mid, e)
+            count[node] = 0
+            stack.append((left[node], s, mid))
+            stack.append((right[node], mid, e))
+
+        self.tris = self.tris[order]
+        self.owners = self.owners[order]
+        self.node_lo = np.array(lo).reshape(-1, 3)
+        self.node_hi = np.array(hi).reshape(-1, 3)
+        self.node_left = np.array(left, dtype=int)
+        self.node_right = np.array(right, dtype=int)
+        self.node_start = np.array(start, dtype=int)
+        self.node_count = np.array(count, dtype=int)
+
+    def query_box(self, lo, hi):
+        """returns indices of faces whose node bounds overlap [lo, hi]"""
+        if len(self.tris) == 0:
+            return np.zeros(0, dtype=int)
+        found = []
+        stack = [0]
+        while len(stack) > 0:
+            node = stack.pop()
+            if (np.any(self.node_lo[node] > hi)
+                    or np.any(self.node_hi[node] < lo)):
+                continue
+            if self.node_left[node] < 0:
+                s = self.node_start[node]
+                found.append(np.arange(s, s + self.node_count[node]))
+            else:
+                stack.append(self.node_left[node])
+                stack.append(self.node_right[node])
+        if len(found) == 0:
+            return np.zeros(0, dtype=int)
+        return np.concatenate(found)
+
+    def query_prism(self, triangle, sunvec, near, far):
+        """
+        Find solids hit by `triangle` extruded along `sunvec`.
+
+        returns a list of (owner, distance) ordered by distance to the
+        center of the triangle, nearest first; owner indexes `ids` and
+        `solids`
+        """
+        lo, hi = prism_bounds(triangle, sunvec, near, far)
+        candidates = self.query_box(lo, hi)
+        if len(candidates) == 0:
+            return []
+
+        tris = self.tris[candidates]
+        hits = prism_hits(tris, triangle, sunvec, near, far)
+        if not np.any(hits):
+            return []
+
+        center = (triangle.a + triangle.b + triangle.c) / 3.0
+        tris = tris[hits]
+        owners = self.owners[candidates][hits]
+        dists = np.linalg.norm(tris - center, axis=2).min(axis=1)
+
+        nearest = dict()
+        for owner, dist in zip(owners, dists):
+            if dist < nearest.get(owner, math.inf):
+                nearest[owner] = dist
+
+        return sorted(nearest.items(), key=lambda x: x[1])
+
+
+class TileIndex:
+    """
+    Keep BVHs of square tiles of solids, loaded on demand through
+    `fetch(xmin, ymin, xmax, ymax)`, which must yield
+    (id, (n, 3, 3) array of triangles) for the solids overlapping
+    the given box.
+
+    Only the last `max_tiles` used tiles are kept, a tile whose fetch
+    raised is not kept and is fetched again on next use.
+    """
+
+    def __init__(self, fetch, tile_size, max_tiles, leaf_size=LEAF_SIZE):
+        self._fetch = fetch
+        self._tiles = OrderedDict()
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.leaf_size = leaf_size
+
+    def tile_keys(self, lo, hi):
+        ts = self.tile_size
+        for ix in range(int(lo[0] // ts), int(hi[0] // ts) + 1):
+            for iy in range(int(lo[1] // ts), int(hi[1] // ts) + 1):
+                yield ix, iy
+
+    def get_tile(self, key):
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+
+        ix, iy = key
+        ts = self.tile_size
+        bvh = SolidBVH(
+            self._fetch(ix * ts, iy * ts, (ix + 1) * ts, (iy + 1) * ts),
+            self.leaf_size,
+        )
+        logger.debug('TileIndex loaded {} with {} solids'.format(
+            key, len(bvh)))
+        self._tiles[key] = bvh
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return bvh
+
+    def query_box(self, lo, hi):
+        """
+        returns a (n, 3, 3) array of faces of solids whose bounds might
+        overlap [lo, hi], each solid being taken from a single tile
+        """
+        seen = set()
+        found = []
+        for key in self.tile_keys(lo, hi):
+            tile = self.get_tile(key)
+            faces = tile.query_box(lo, hi)
+            owners = tile.owners[faces]
+            for owner in np.unique(owners):
+                id = tile.ids[owner]
+                if id not in seen:
+                    seen.add(id)
+                    found.append(tile.tris[faces[owners == owner]])
+        if len(found) == 0:
+            return np.zeros((0, 3, 3))
+        return np.concatenate(found)
+
+    def query_prism(self, triangle, sunvec, near, far):
+        """
+        returns (id, (n, 3, 3) array of triangles) of solids hit by the
+        prism, nearest first
+        """
+        lo, hi = prism_bounds(triangle, sunvec, near, far)
+        nearest = dict()
+        for key in self.tile_keys(lo, hi):
+            tile = self.get_tile(key)
+            for owner, dist in tile.query_prism(triangle, sunvec, near, far):
+                id = tile.ids[owner]
+                if id not in nearest or dist < nearest[id][0]:
+                    nearest[id] = (dist, tile.solids[owner])
+
+        return [(id, tris) for id, (_, tris) in
+                sorted(nearest.items(), key=lambda x: x[1][0])]
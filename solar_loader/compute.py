@@ -1,21 +1,27 @@
 import logging
+import math
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from functools import partial
 import traceback
 
 import numpy as np
 from psycopg2.extensions import AsIs
+import shapely
 from shapely import geometry, ops
 
 from .geom import (
     GeometryMissingDimension,
+    as_triangle_array,
     get_flattening_mat,
+    intersect_rays_triangles,
+    sample_triangle,
     get_triangle_area,
     get_triangle_inclination,
     get_triangle_azimut,
     tesselate,
     transform_multipolygon,
     transform_triangle,
+    transform_triangles,
     unit_vector,
     translation_matrix,
     multipolygon_drop_z,
@@ -82,10 +88,11 @@ def get_exposed_area(gis_triangle, sunvec, row_intersect):
 
     for i, solid in enumerate(row_intersect):
         # apply same transformation than the flatten triangle
-        flatten_solid = transform_multipolygon(flat_mat, solid)
+        flatten_solid = transform_triangles(flat_mat, as_triangle_array(solid))
 
-        for s in flatten_solid.geoms:
+        for t in flatten_solid:
             try:
+                s = geometry.Polygon(t)
                 intersection = unioner(intersection,
                                        triangle_2d.intersection(s))
                 if intersection is not None:
@@ -125,6 +132,103 @@ def get_exposed_area(gis_triangle, sunvec, row_intersect):
     #         return 1.0
 
 
+# faces clipped and merged at once by get_exposed_area_vectorized
+EXPOSURE_CHUNK = 256
+# share of a triangle left exposed by rounding when it is fully shaded
+EXPOSURE_EPSILON = 1e-9
+
+
+def get_exposed_area_vectorized(gis_triangle, sunvec, row_intersect,
+                                chunk=EXPOSURE_CHUNK):
+    """
+    Same as get_exposed_area, with faces flattened in one matrix product and
+    clipped and merged by chunks with shapely ufuncs. The early return on
+    a fully shaded triangle is checked after each chunk.
+    """
+    try:
+        center = gis_triangle.center
+        trans_mat = translation_matrix(*(-center))
+        rot_mat = get_flattening_mat(sunvec)
+        flat_mat = trans_mat @ rot_mat
+    except GeometryMissingDimension:
+        logger.error('Could not build a flattening matrix')
+        return 1.0
+
+    flat_triangle = transform_triangle(flat_mat, gis_triangle.geom)
+    triangle_2d = geometry.Polygon([
+        flat_triangle.a[:2],
+        flat_triangle.b[:2],
+        flat_triangle.c[:2],
+    ])
+    triangle_area = triangle_2d.area
+    if triangle_area <= 0:
+        return 1.0
+
+    solids = [as_triangle_array(solid) for solid in row_intersect]
+    solids = [s for s in solids if len(s) > 0]
+    if len(solids) == 0:
+        return 1.0
+    faces = transform_triangles(flat_mat, np.concatenate(solids))[:, :, :2]
+
+    # faces seen edge-on cast no shadow, and faces off the triangle's
+    # bounding box cannot overlap it
+    edges_ab = faces[:, 1] - faces[:, 0]
+    edges_ac = faces[:, 2] - faces[:, 0]
+    areas = np.abs(edges_ab[:, 0] * edges_ac[:, 1] -
+                   edges_ab[:, 1] * edges_ac[:, 0]) / 2.0
+    xmin, ymin, xmax, ymax = triangle_2d.bounds
+    lo = faces.min(axis=1)
+    hi = faces.max(axis=1)
+    keep = ((areas > 1e-9)
+            & (hi[:, 0] >= xmin) & (lo[:, 0] <= xmax)
+            & (hi[:, 1] >= ymin) & (lo[:, 1] <= ymax))
+    faces = faces[keep]
+
+    shade = None
+    for start in range(0, len(faces), chunk):
+        try:
+            polygons = shapely.polygons(faces[start:start + chunk])
+            clipped = shapely.intersection(triangle_2d, polygons)
+            if shade is not None:
+                clipped = np.append(clipped, shade)
+            shade = shapely.union_all(clipped)
+        except Exception:
+            traceback.print_exc()
+            continue
+        exposed_rate = (triangle_area - shapely.area(shade)) / triangle_area
+        if exposed_rate <= EXPOSURE_EPSILON:
+            return 0
+
+    if shade is None:
+        return 1.0
+    return exposed_rate
+
+
+def get_exposed_area_raycast(gis_triangle, sunvec, row_intersect, density,
+                             min_points=16, near=1.0):
+    """
+    Estimate the exposed rate of a triangle by casting rays towards the sun
+    from a stratified grid of points on the triangle.
+
+    density    -- points per square meter
+    min_points -- lower bound on the number of points
+    near       -- obstacles closer than this along sunvec are ignored
+    """
+    n = max(min_points, gis_triangle.area * density)
+    points = sample_triangle(gis_triangle.geom, int(math.ceil(math.sqrt(n))))
+    blocked = np.zeros(len(points), dtype=bool)
+
+    for solid in row_intersect:
+        tris = as_triangle_array(solid)
+        open_points = np.flatnonzero(~blocked)
+        blocked[open_points] = intersect_rays_triangles(
+            points[open_points], sunvec, tris, near)
+        if np.all(blocked):
+            return 0
+
+    return 1.0 - np.count_nonzero(blocked) / len(points)
+
+
 # def worker(db, tmy, sample_rate, gis_triangles, with_shadows, day):
 #     alb = 0.2
 #     daily_radiations = []
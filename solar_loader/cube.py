@@ -0,0 +1,161 @@
+"""
+Annual irradiance cube.
+
+Unshaded global and direct irradiance only depend on the TMY, the sample
+rate (through the rolling averages of G_Gh and G_Dh) and the orientation
+rounded to 5 degrees. They are computed once for every TMY hour and every
+orientation of the rdiso5 grid, and stored as a float32 array of shape
+(73 azimuths, 19 tilts, 8760 hours, 2), so that the year of an orientation
+is contiguous. Workers memory-map it and read irradiance, interpolated
+between the surrounding orientations, instead of evaluating the Perez
+model.
+
+Rolling averages follow the local time of the sample days, they shift by
+an hour across daylight saving time changes. The cube is therefore built
+for the year of the runs, which get_days takes from the current date.
+
+A JSON sidecar records the sample rate, the year and the checksum of the
+TMY the cube was built from.
+"""
+
+import json
+import logging
+from pathlib import Path
+import numpy as np
+
+from .radiation import compute_gk_array
+from .rdiso import rdiso_table
+from .time import hours_for_year
+from .tmy import file_checksum
+
+logger = logging.getLogger(__name__)
+
+STEP = 5
+AZIMUTHS = np.arange(0, 361, STEP)
+TILTS = np.arange(0, 91, STEP)
+HOURS = 8760
+GK = 0
+BK = 1
+# hours computed at once when building
+BUILD_CHUNK = 24 * 31
+
+
+def _sidecar(path):
+    return Path('{}.json'.format(path))
+
+
+def rolling_mean(values, sample_rate):
+    """
+    The average, for each hour, of the values at the same hour over
+    sample_rate days, as TMY.get_float_average computes it away from
+    daylight saving time changes.
+    """
+    sr = int(sample_rate)
+    days = np.arange(sr) - sr // 2
+    return np.mean([np.roll(values, -24 * d) for d in days], axis=0)
+
+
+def build_cube(tmy, sample_rate, path, year):
+    """
+    tmy         -- a tmy.TMY
+    sample_rate -- the sample rate of runs using the cube
+    path        -- where to save the cube
+    year        -- the year of runs using the cube
+    """
+    if len(tmy) != HOURS:
+        raise ValueError('Expected {} TMY rows, got {}'.format(
+            HOURS, len(tmy)))
+
+    def column(key):
+        return tmy.columns[key].astype(float)
+
+    gh = rolling_mean(column('G_Gh'), sample_rate)
+    dh = rolling_mean(column('G_Dh'), sample_rate)
+    sza = 90.0 - column('hs')
+    saa = column('Az')
+    month = column('m').astype(int)
+    index = np.arange(HOURS)
+    # hours of the year get averages and months as the pipeline computes
+    # them, only the hour skipped by the switch to summer time keeps the
+    # plain rolling mean
+    times = list(hours_for_year(year))
+    rows = tmy.get_indices(times)
+    gh[rows] = tmy.get_float_averages('G_Gh', times, sample_rate)
+    dh[rows] = tmy.get_float_averages('G_Dh', times, sample_rate)
+    month[rows] = [t.month for t in times]
+
+    azimuth, tilt = np.meshgrid(AZIMUTHS, TILTS, indexing='ij')
+    orientation = (azimuth[..., None], tilt[..., None],
+                   rdiso_table[..., 0, None], rdiso_table[..., 1, None])
+
+    cube = np.lib.format.open_memmap(
+        Path(path).as_posix(),
+        mode='w+',
+        dtype=np.float32,
+        shape=(len(AZIMUTHS), len(TILTS), HOURS, 2))
+    for start in range(0, HOURS, BUILD_CHUNK):
+        hours = slice(start, start + BUILD_CHUNK)
+        az, ti, rdiso_flat, rdiso_tilt = orientation
+        gk, bk = compute_gk_array(gh[hours], dh[hours], sza[hours],
+                                  saa[hours], 0.2, az, ti, 28, 1,
+                                  month[hours], index[hours], rdiso_flat,
+                                  rdiso_tilt)
+        cube[:, :, hours, GK] = gk
+        cube[:, :, hours, BK] = bk
+    cube.flush()
+    del cube
+
+    with open(_sidecar(path), 'w') as f:
+        json.dump(
+            dict(sample_rate=int(sample_rate),
+                 year=int(year),
+                 tmy=file_checksum(tmy.path)), f)
+    logger.info('Irradiance cube saved to {}'.format(path))
+
+
+def load_cube(path, tmy_path, sample_rate, year):
+    """
+    Memory-map the cube at path, returns None if it is missing or was
+    built for another TMY, sample rate or year.
+    """
+    try:
+        with open(_sidecar(path)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError) as ex:
+        logger.error('Could not read irradiance cube metadata: {}'.format(ex))
+        return None
+
+    if meta.get('sample_rate') != int(sample_rate):
+        logger.error('Irradiance cube {} was built for a sample rate of {}'.
+                     format(path, meta.get('sample_rate')))
+        return None
+    if meta.get('year') != int(year):
+        logger.error('Irradiance cube {} was built for {}'.format(
+            path, meta.get('year')))
+        return None
+    if meta.get('tmy') != file_checksum(tmy_path):
+        logger.error('Irradiance cube {} was built for another TMY'.format(
+            path))
+        return None
+
+    return np.load(Path(path).as_posix(), mmap_mode='r')
+
+
+def cube_radiations(cube, azimuth, tilt, hours):
+    """
+    Global and direct irradiance for an orientation at TMY hours,
+    interpolated between the four surrounding orientations of the cube.
+
+    returns two arrays of the length of hours
+    """
+    a = min(max(azimuth, 0), AZIMUTHS[-1]) / STEP
+    t = min(max(tilt, 0), TILTS[-1]) / STEP
+    a0 = min(int(a), len(AZIMUTHS) - 2)
+    t0 = min(int(t), len(TILTS) - 2)
+    wa = a - a0
+    wt = t - t0
+    cells = cube[a0:a0 + 2, t0:t0 + 2][:, :, hours].astype(float)
+    weights = np.array([[(1 - wa) * (1 - wt), (1 - wa) * wt],
+                        [wa * (1 - wt), wa * wt]])
+    values = np.einsum('at,athk->hk', weights, cells)
+    return values[:, GK], values[:, BK]
@@ -1,37 +1,72 @@
+from datetime import datetime
 import itertools as it
+from collections import OrderedDict
 from functools import partial
 import logging
+import math
+import os
+import threading
+from psycopg2 import Binary
 from psycopg2.extensions import AsIs
 import django
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import Manager
 import traceback
+import numpy as np
 
 from .time import now
-from .store import Data
+from .store import Data, balancer_stats, get_queries, pool_stats, use_balancer, use_pools
 from .tmy import TMY
 from .records import GisTriangle, Triangle
-from .time import generate_sample_days
+from .time import brussels_zone, generate_sample_days, generate_sample_times
 from .geom import (
     get_triangle_area,
     get_triangle_azimut,
     get_triangle_center,
     get_triangle_inclination,
+    get_triangle_normal,
     tesselate_earcut,
     ctor_triangle,
-    ctor_polygon,
     unit_vector,
 )
-from .sunpos import get_sun_position
+from .sunpos import SunCache, get_sun_position, get_sun_positions
 from .lingua import (
     make_polyhedral,
+    make_polyhedral_wkb,
     rows_with_geom,
     tesselate_to_shape,
     make_point_from_center,
+    make_point_wkb,
+    make_footprint_hull,
+    make_footprint_hull_wkb,
+    load_geom,
 )
-from .compute import get_exposed_area, get_roof_area
-from .rdiso import get_rdiso5
-from .radiation import compute_gk
+from .compute import (
+    get_exposed_area,
+    get_exposed_area_raycast,
+    get_exposed_area_vectorized,
+    get_roof_area,
+)
+from .bvh import SolidBVH, TileIndex
+from .shared_cache import SharedSolidCache
+from .horizon import (
+    HorizonStore,
+    compute_horizon,
+    sky_visibility,
+    sun_visibility,
+    triangle_points,
+)
+from .rdiso import get_rdiso, get_rdiso5
+from .async_engine import (
+    AsyncQueryEngine,
+    available as async_available,
+    connect_databases,
+    connect_params,
+)
+from .cube import cube_radiations, load_cube
+from .radiation import compute_gk, roof_rdiso_array, sky_state, surface_gk
 
 logger = logging.getLogger(__name__)
 
@@ -44,9 +79,49 @@ flat_threshold = getattr(settings, "SOLAR_FLAT_THRESHOLD", 5)
 flat_area_rate = getattr(settings, "SOLAR_FLAT_AREA_RATE", 0.57)
 optimal_azimuth = getattr(settings, "SOLAR_OPTIMAL_AZIMUTH", 180)
 optimal_tilt = getattr(settings, "SOLAR_OPTIMAL_TILT", 40)
+shadow_engine = getattr(settings, "SOLAR_SHADOW_ENGINE", "postgis")
+bvh_tile_size = getattr(settings, "SOLAR_BVH_TILE_SIZE", 250)
+bvh_max_tiles = getattr(settings, "SOLAR_BVH_MAX_TILES", 16)
+exposure_mode = getattr(settings, "SOLAR_EXPOSURE_MODE", "union")
+raycast_density = getattr(settings, "SOLAR_RAYCAST_DENSITY", 4)
+raycast_min_points = getattr(settings, "SOLAR_RAYCAST_MIN_POINTS", 16)
+horizon_bins = getattr(settings, "SOLAR_HORIZON_BINS", 360)
+horizon_cache = getattr(settings, "SOLAR_HORIZON_CACHE", None)
+horizon_rdiso = getattr(settings, "SOLAR_HORIZON_RDISO", False)
+irradiance_cube = getattr(settings, "SOLAR_IRRADIANCE_CUBE", None)
+rdiso_interpolate = getattr(settings, "SOLAR_RDISO_INTERPOLATE", False)
+shared_cache_size = getattr(settings, "SOLAR_SHARED_CACHE_SIZE", 0)
+intersect_cache_entries = getattr(settings, "SOLAR_INTERSECT_CACHE_ENTRIES", 0)
+intersect_cache_bytes = getattr(settings, "SOLAR_INTERSECT_CACHE_BYTES", 2**30)
+cache_log_interval = getattr(settings, "SOLAR_CACHE_LOG_INTERVAL", 100)
+sweep_mode = getattr(settings, "SOLAR_SWEEP", "hour")
+batch_order = getattr(settings, "SOLAR_BATCH_ORDER", "id")
+sun_engine = getattr(settings, "SOLAR_SUN_ENGINE", "pysolar")
+sun_cell_size = getattr(settings, "SOLAR_SUN_CELL_SIZE", 0)
+sun_cache_entries = getattr(settings, "SOLAR_SUN_CACHE_ENTRIES", 2**17)
+prepared_queries = getattr(settings, "SOLAR_PREPARED_QUERIES", [])
+geometry_format = getattr(settings, "SOLAR_GEOMETRY_FORMAT", "wkt")
+pool_size = getattr(settings, "SOLAR_POOL_SIZE", 0)
+pool_timeout = getattr(settings, "SOLAR_POOL_TIMEOUT", None)
+connection_policy = getattr(settings, "SOLAR_CONNECTION_POLICY", "random")
+eject_failures = getattr(settings, "SOLAR_EJECT_FAILURES", 3)
+eject_time = getattr(settings, "SOLAR_EJECT_TIME", 30)
+async_connections = getattr(settings, "SOLAR_ASYNC_CONNECTIONS", 4)
+async_batch = getattr(settings, "SOLAR_ASYNC_BATCH", 64)
+async_timeout = getattr(settings, "SOLAR_ASYNC_TIMEOUT", 60)
 
 print("sample_rate: {}".format(sample_rate))
 print("with_shadows: {}".format(with_shadows))
+logger.info("shadow_engine: {}".format(shadow_engine))
+logger.info("exposure_mode: {}".format(exposure_mode))
+logger.info("sweep_mode: {}".format(sweep_mode))
+logger.info("batch_order: {}".format(batch_order))
+logger.info("sun_engine: {}".format(sun_engine))
+logger.info("sun_cell_size: {}".format(sun_cell_size))
+logger.info("prepared_queries: {}".format(prepared_queries))
+logger.info("geometry_format: {}".format(geometry_format))
+logger.info("pool_size: {}".format(pool_size))
+logger.info("connection_policy: {}".format(connection_policy))
 
 STATUS_TODO = 0
 STATUS_PENDING = 1
@@ -57,6 +132,10 @@ STATUS_ACK = 4
 MAX_WORKERS = 32
 TIMEOUT = 60
 
+# extrusion of a triangle towards the sun, in meters
+SHADOW_NEAR = 1.0
+SHADOW_FAR = 200.0
+
 
 def round5(f):
     mul = f // 5
@@ -65,17 +144,51 @@ def round5(f):
     return mul * 5
 
 
-def compute_radiation(exposed_rate, tim, triangle):
-    azimuth = triangle.azimuth
-    tilt = triangle.tilt
+def get_orientation(triangle):
+    """azimuth and tilt used for triangle, flat ones are given the optimal"""
+    if triangle.tilt <= flat_threshold:
+        return optimal_azimuth, optimal_tilt
+    return triangle.azimuth, triangle.tilt
+
+
+def get_rdiso_values(azimuth, tilt):
+    """rdiso_flat and rdiso for an orientation"""
+    if rdiso_interpolate:
+        rdiso_flat, rdiso = get_rdiso(azimuth, tilt)
+        return float(rdiso_flat), float(rdiso)
+    return get_rdiso5(round5(azimuth), round5(tilt))
 
-    is_flat = tilt <= flat_threshold
 
-    if is_flat:
-        azimuth = optimal_azimuth
-        tilt = optimal_tilt
+_cube = None
 
-    rdiso_flat, rdiso = get_rdiso5(round5(azimuth), round5(tilt))
+
+def get_cube():
+    """the irradiance cube of this process, memory-mapped on first use"""
+    global _cube
+    if _cube is None and irradiance_cube is not None:
+        _cube = load_cube(
+            irradiance_cube,
+            settings.SOLAR_TMY,
+            sample_rate,
+            datetime.now(brussels_zone).year,
+        )
+        if _cube is None:
+            logger.error("Irradiance cube not used, falling back to compute_gk")
+            _cube = False
+    return _cube if _cube is not False else None
+
+
+def get_radiation(tim, triangle):
+    """
+    returns the diffuse and direct irradiance on triangle at tim, the
+    latter for a fully exposed triangle
+    """
+    if get_cube() is not None:
+        diffuse, direct = get_radiations([tim], triangle)
+        return diffuse[0], direct[0]
+
+    azimuth, tilt = get_orientation(triangle)
+    rdiso_flat, rdiso = get_rdiso_values(azimuth, tilt)
     gh = tmy.get_float_average("G_Gh", tim, sample_rate)
     dh = tmy.get_float_average("G_Dh", tim, sample_rate)
     hs = tmy.get_float("hs", tim)
@@ -99,78 +212,536 @@ def compute_radiation(exposed_rate, tim, triangle):
         rdiso,
     )
 
-    diffuse = radiation_global - radiation_direct
-    direct = exposed_rate * radiation_direct
+    return radiation_global - radiation_direct, radiation_direct
+
+
+def make_sky_state(times):
+    """the surface independent part of the Perez model for times"""
+    tmy_index = tmy.get_indices(times)
+    gh = tmy.get_float_averages("G_Gh", times, sample_rate)
+    dh = tmy.get_float_averages("G_Dh", times, sample_rate)
+    hs = tmy.get_floats("hs", tmy_index)
+    Az = tmy.get_floats("Az", tmy_index)
+    month = [tim.month for tim in times]
+
+    return sky_state(
+        gh,
+        dh,
+        90.0 - hs,
+        Az,
+        28,  # Meteonorm 7 Output Preview for Bruxelles centre
+        month,
+        tmy_index,
+    )
+
+
+_sky_states = None
+
+
+def get_sky_state(times):
+    """
+    sky states for times, the ones of the sample hours of a run are
+    computed once and shared by all roofs
+    """
+    global _sky_states
+    if _sky_states is None:
+        sample_times = list(generate_sample_times(sample_rate))
+        _sky_states = (
+            {tim: i for i, tim in enumerate(sample_times)},
+            make_sky_state(sample_times),
+        )
+    rows, states = _sky_states
+    index = [rows.get(tim) for tim in times]
+    if None in index:
+        return make_sky_state(times)
+    return states[index]
+
+
+def get_radiations(times, triangle, sky=None):
+    """
+    returns arrays of diffuse and direct irradiance on triangle for times,
+    computed at once from their sky states
+
+    sky -- optional (360, 90) visibility of sky elements, the isotropic
+           diffuse view factors are then computed for it instead of
+           taken from the unobstructed table
+    """
+    azimuth, tilt = get_orientation(triangle)
+    cube = get_cube()
+    if sky is None and cube is not None:
+        gk, bk = cube_radiations(
+            cube, azimuth, tilt, tmy.get_indices(times)
+        )
+        return gk - bk, bk
+
+    if sky is None:
+        rdiso_flat, rdiso = get_rdiso_values(azimuth, tilt)
+    else:
+        rdiso_flat, rdiso = roof_rdiso_array(azimuth, tilt, sky)
+
+    radiation_global, radiation_direct = surface_gk(
+        get_sky_state(times), 0.2, azimuth, tilt, 1, rdiso_flat, rdiso
+    )
+
+    return radiation_global - radiation_direct, radiation_direct
 
-    return (diffuse + direct) * sample_rate
+
+def compute_radiation(exposed_rate, tim, triangle):
+    diffuse, direct = get_radiation(tim, triangle)
+    return (diffuse + exposed_rate * direct) * sample_rate
 
 
 class IntersectCache:
-    def __init__(self):
-        self._cache = dict()
+    """
+    Triangulated solids, as (n, 3, 3) arrays, keyed by gml_id.
+
+    The cache is bounded by a number of entries and an estimated size in
+    bytes, least recently used solids being evicted first. Either bound
+    can be disabled with 0.
+
+    When attached to a SharedSolidCache, triangles live in shared memory
+    and are triangulated once for all worker processes of the node.
+
+    The threads of a roof share the cache; solids are triangulated outside
+    of its lock, so two threads missing the same solid may both do it.
+    """
+
+    def __init__(self, max_entries=0, max_bytes=0):
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared = None
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+
+    def attach(self, shared):
+        self._shared = shared
+
+    def _tesselate(self, geoms):
+        triangles = []
+        for geom in geoms:
+            try:
+                triangles.extend(tesselate_earcut(geom.exterior.coords, ctor_triangle))
+            except Exception as ex:
+                ex_str = str(ex)
+                logger.error(f'get_solid error: {ex_str}')
+        if len(triangles) == 0:
+            return np.zeros((0, 3, 3))
+        return np.array(triangles, dtype=float)
+
+    @staticmethod
+    def _size(triangles):
+        # views on a SharedSolidCache do not weigh on this process
+        return triangles.nbytes if triangles.flags.owndata else 0
+
+    def _evict(self):
+        while len(self._cache) > 0 and (
+            (self.max_entries > 0 and len(self._cache) > self.max_entries)
+            or (self.max_bytes > 0 and self.bytes > self.max_bytes)
+        ):
+            _, triangles = self._cache.popitem(last=False)
+            self.bytes -= self._size(triangles)
+            self.evictions += 1
 
     def get_solid(self, row):
         id = row[0]
-        if id not in self._cache:
-            triangles = []
-            for geom in row[1].geoms:
-                try:
-                    triangles.extend(tesselate_earcut(geom.exterior.coords, ctor_polygon))
-                except Exception as ex:
-                    ex_str = str(ex)
-                    logger.error(f'get_solid error: {ex_str}')
+        with self._lock:
+            triangles = self._cache.get(id)
+            if triangles is not None:
+                self.hits += 1
+                self._cache.move_to_end(id)
+                return triangles
+            self.misses += 1
+
+        triangles = None
+        if self._shared is not None:
+            triangles = self._shared.get(id)
+        if triangles is None:
+            triangles = self._tesselate(row[1].geoms)
+            if self._shared is not None:
+                shared = self._shared.put(id, triangles)
+                if shared is not None:
+                    triangles = shared
+        with self._lock:
+            if id in self._cache:
+                # triangulated by another thread meanwhile
+                self._cache.move_to_end(id)
+                return self._cache[id]
             self._cache[id] = triangles
-        return self._cache[id]
+            self.bytes += self._size(triangles)
+            self._evict()
+        return triangles
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(
+                entries=len(self._cache),
+                bytes=self.bytes,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                hit_rate=self.hits / lookups if lookups > 0 else 0.0,
+            )
 
 
-intersect_cache = IntersectCache()
+intersect_cache = IntersectCache(intersect_cache_entries, intersect_cache_bytes)
+
+
+def solid_query(name):
+    """name of the query returning solids in geometry_format"""
+    if geometry_format == "wkb":
+        return name + "_wkb"
+    return name
 
 
 def query_intersections(db, triangle, sunvec):
-    nearvec = sunvec * 1.0
-    farvec = sunvec * 200.0
+    nearvec = sunvec * SHADOW_NEAR
+    farvec = sunvec * SHADOW_FAR
     triangle_near = Triangle(
         triangle.a + nearvec, triangle.b + nearvec, triangle.c + nearvec
     )
     triangle_far = Triangle(
         triangle.a + farvec, triangle.b + farvec, triangle.c + farvec
     )
-    polyhedr = make_polyhedral(triangle_near, triangle_far)
-
-    select = rows_with_geom(
-        db,
-        "select_intersect",
-        (
-            AsIs(polyhedr),
-            AsIs(
-                make_point_from_center(triangle),
-            ),
-        ),
-        1,
-    )
+    if geometry_format == "wkb":
+        params = (
+            Binary(make_polyhedral_wkb(triangle_near, triangle_far)),
+            Binary(make_point_wkb(get_triangle_center(triangle))),
+        )
+    else:
+        params = (
+            AsIs(make_polyhedral(triangle_near, triangle_far)),
+            AsIs(make_point_from_center(triangle)),
+        )
+
+    select = rows_with_geom(db, solid_query("select_intersect"), params, 1)
     results = map(lambda row: intersect_cache.get_solid(row), list(select))
 
     return results
 
 
-def make_task(day, tr):
-    time_and_vec = []
-    for ti in day:
-        sunpos = get_sun_position(tr.center, ti)
-        sunvec = unit_vector(sunpos.coords - tr.center)
-        time_and_vec.append((ti, sunvec))
+def fetch_solid_box(db, xmin, ymin, xmax, ymax):
+    for row in rows_with_geom(
+        db, solid_query("select_solid_box"), (xmin, ymin, xmax, ymax), 1,
+        strict=True
+    ):
+        yield row[0], intersect_cache.get_solid(row)
+
+
+_tile_index = None
+
+
+def get_tile_index():
+    """The process wide TileIndex, built on first use"""
+    global _tile_index
+    if _tile_index is None:
+        db = Data(
+            settings.SOLAR_CONNECTION, settings.SOLAR_TABLES, prepared=prepared_queries
+        )
+        _tile_index = TileIndex(
+            partial(fetch_solid_box, db), bvh_tile_size, bvh_max_tiles
+        )
+    return _tile_index
+
+
+def query_intersections_bvh(triangle, sunvec):
+    solids = get_tile_index().query_prism(triangle, sunvec, SHADOW_NEAR, SHADOW_FAR)
+    return [tris for _, tris in solids]
+
+
+class SweepCandidates:
+    """
+    Solids that might shade a triangle for a set of sun vectors, fetched
+    with a single query on the 2D convex hull of all the extrusions, then
+    filtered and ordered locally for each sun vector.
+    """
+
+    def __init__(self, triangle):
+        self.triangle = triangle
+        self.sunvecs = []
+        self._index = None
+        self._lock = threading.Lock()
+
+    def add(self, sunvec):
+        self.sunvecs.append(sunvec)
+
+    def _fetch(self, db):
+        t = self.triangle
+        points = [t.a, t.b, t.c]
+        for sunvec in self.sunvecs:
+            for d in (SHADOW_NEAR, SHADOW_FAR):
+                points.extend([t.a + sunvec * d, t.b + sunvec * d, t.c + sunvec * d])
+        if geometry_format == "wkb":
+            hull = Binary(make_footprint_hull_wkb(points))
+        else:
+            hull = AsIs(make_footprint_hull(points))
+        rows = rows_with_geom(
+            db, solid_query("select_sweep"), (hull, hull), 1, strict=True
+        )
+        return SolidBVH((row[0], intersect_cache.get_solid(row)) for row in rows)
+
+    def query(self, db, sunvec):
+        with self._lock:
+            if self._index is None:
+                self._index = self._fetch(db)
+        return query_index(self._index, self.triangle, sunvec)
+
+
+def query_index(index, triangle, sunvec):
+    """solids of a SolidBVH hit by the extrusion of triangle, nearest first"""
+    hits = index.query_prism(triangle, sunvec, SHADOW_NEAR, SHADOW_FAR)
+    return [index.solids[owner] for owner, _ in hits]
+
+
+_async_engine = None
+
+
+def get_async_engine():
+    """The AsyncQueryEngine of this process, started on first use"""
+    global _async_engine
+    if _async_engine is None:
+        aliases = settings.SOLAR_CONNECTION
+        if isinstance(aliases, str):
+            aliases = [aliases]
+        params = [connect_params(settings.DATABASES[a]) for a in aliases]
+        _async_engine = AsyncQueryEngine(connect_databases(params), async_connections)
+    return _async_engine
+
+
+class AsyncIntersections:
+    """
+    Extrusions of the lit hours of a roof, added while its tasks are
+    made, then all queried on the async engine the first time a task
+    needs one: in statements of async_batch extrusions, all of them in
+    flight at once.
+    """
+
+    def __init__(self):
+        self.extrusions = []
+        self._results = None
+        self._lock = threading.Lock()
+
+    def add(self, triangle, sunvec):
+        """returns the number to get the solids hit by this extrusion"""
+        self.extrusions.append((triangle, sunvec))
+        return len(self.extrusions) - 1
+
+    def _fetch(self):
+        volumes = []
+        centers = []
+        for triangle, sunvec in self.extrusions:
+            near = Triangle(*[p + sunvec * SHADOW_NEAR for p in triangle])
+            far = Triangle(*[p + sunvec * SHADOW_FAR for p in triangle])
+            volumes.append(make_polyhedral_wkb(near, far))
+            centers.append(make_point_wkb(get_triangle_center(triangle)))
+
+        starts = range(0, len(volumes), async_batch)
+        # statements run async_connections at a time
+        rounds = -(-len(starts) // async_connections)
+        batches = get_async_engine().fetch_all(
+            get_queries(settings.SOLAR_TABLES)["select_intersect_batch"],
+            [
+                (volumes[s : s + async_batch], centers[s : s + async_batch])
+                for s in starts
+            ],
+            timeout=async_timeout * max(1, rounds),
+        )
+        results = [[] for _ in self.extrusions]
+        for start, rows in zip(starts, batches):
+            for i, id, geom in rows:
+                solid = intersect_cache.get_solid([id, load_geom(geom)])
+                results[start + i - 1].append(solid)
+        return results
+
+    def get(self, number):
+        with self._lock:
+            if self._results is None:
+                self._results = self._fetch()
+        return self._results[number]
+
+
+def prefetch_roof_solids(db, triangles):
+    """
+    Index all solids within shadow reach of the triangles of a roof,
+    fetched with a single query.
+    """
+    vertices = np.array([v for t in triangles for v in t.geom])
+    lo = vertices.min(axis=0)
+    hi = vertices.max(axis=0)
+    center = (lo + hi) / 2.0
+    reach = np.linalg.norm(hi - lo) / 2.0 + SHADOW_FAR
+    if geometry_format == "wkb":
+        point = Binary(make_point_wkb(center))
+    else:
+        point = AsIs(
+            "ST_GeomFromText('POINT Z({:.2f} {:.2f} {:.2f})', 31370)".format(*center)
+        )
+    rows = rows_with_geom(
+        db, solid_query("select_prefetch"), (point, reach), 1, strict=True
+    )
+    return SolidBVH((row[0], intersect_cache.get_solid(row)) for row in rows)
+
+
+def get_exposed_rate(tr, sunvec, row_intersect):
+    if exposure_mode == "raycast":
+        return get_exposed_area_raycast(
+            tr,
+            sunvec,
+            row_intersect,
+            raycast_density,
+            raycast_min_points,
+            SHADOW_NEAR,
+        )
+    if exposure_mode == "vectorized":
+        return get_exposed_area_vectorized(tr, sunvec, row_intersect)
+    return get_exposed_area(tr, sunvec, row_intersect)
+
+
+_horizon_store = None
+
+
+def get_horizon_store():
+    global _horizon_store
+    if _horizon_store is None and horizon_cache is not None:
+        _horizon_store = HorizonStore(horizon_cache)
+    return _horizon_store
+
+
+def get_roof_horizons(roof_id, triangles):
+    """
+    Horizon maps for the triangles of a roof, taken from the store when
+    already computed
+    """
+    geoms = np.array([[t.geom.a, t.geom.b, t.geom.c] for t in triangles])
+    store = get_horizon_store()
+    if store is not None:
+        horizons = store.get(roof_id, geoms, horizon_bins)
+        if horizons is not None:
+            return horizons
+
+    vertices = geoms.reshape(-1, 3)
+    solids = get_tile_index().query_box(
+        vertices.min(axis=0) - SHADOW_FAR, vertices.max(axis=0) + SHADOW_FAR
+    )
+    horizons = np.array(
+        [
+            compute_horizon(
+                triangle_points(t.geom), solids, horizon_bins, SHADOW_NEAR, SHADOW_FAR
+            )
+            for t in triangles
+        ]
+    )
+    if store is not None:
+        store.put(roof_id, geoms, horizons)
+    return horizons
+
+
+def get_day_positions(point, day):
+    """sun positions seen from point for the times of a day"""
+    if sun_engine == "vectorized":
+        return get_sun_positions(point, day)
+    return [get_sun_position(point, ti) for ti in day]
+
+
+if sun_cell_size > 0:
+    sun_cache = SunCache(sun_cell_size, sun_cache_entries, get_day_positions)
+else:
+    sun_cache = None
+
+
+def get_sun_vectors(day, tr):
+    """
+    returns a list of (is_daylight, unit vector towards the sun) at the
+    center of triangle for the times of a day
+    """
+    if sun_cache is not None:
+        return sun_cache.get(tr.center, day)
+    return [
+        (sunpos.is_daylight, unit_vector(sunpos.coords - tr.center))
+        for sunpos in get_day_positions(tr.center, day)
+    ]
+
+
+class ShadowCounter:
+    """counts hours for which shadows are computed or skipped"""
+
+    def __init__(self):
+        self.computed = 0
+        self.skipped = 0
+
+
+shadow_counter = ShadowCounter()
+
+
+def make_task(
+    day, tr, horizon=None, sweep=None, index=None, sky=None, pending=None
+):
+    """
+    Before any shadow is looked for, hours are filtered on whether they
+    can contribute direct radiation at all: the sun must be up, in front
+    of the triangle, and the TMY must have direct irradiance for this
+    orientation. Other hours get no shadows, their direct irradiance,
+    if any, counts as fully exposed as it always did.
+    """
+    normal = get_triangle_normal(tr.geom)
+    hours = []
+    pending_numbers = []
+    for ti, (is_daylight, sunvec), diffuse, direct in zip(
+        day, get_sun_vectors(day, tr), *get_radiations(day, tr, sky)
+    ):
+        lit = is_daylight and direct > 0 and np.dot(sunvec, normal) > 0
+        hours.append((ti, sunvec, lit, diffuse, direct))
+        if sweep is not None and lit:
+            sweep.add(sunvec)
+        if pending is not None and lit:
+            pending_numbers.append(pending.add(tr.geom, sunvec))
+
+    def get_intersections(db, sunvec):
+        if sweep is not None:
+            return sweep.query(db, sunvec)
+        return query_intersections(db, tr.geom, sunvec)
+
+    def get_exposures(db, executor, sunvecs):
+        if horizon is not None:
+            return (sun_visibility(horizon, sunvec) for sunvec in sunvecs)
+        if index is not None:
+            intersections = (query_index(index, tr.geom, sunvec) for sunvec in sunvecs)
+        elif pending is not None:
+            intersections = (pending.get(number) for number in pending_numbers)
+        elif shadow_engine == "bvh":
+            intersections = (
+                query_intersections_bvh(tr.geom, sunvec) for sunvec in sunvecs
+            )
+        else:
+            intersections = executor.map(
+                partial(get_intersections, db), sunvecs, timeout=TIMEOUT
+            )
+        return (
+            get_exposed_rate(tr, sunvec, row_intersect)
+            for sunvec, row_intersect in zip(sunvecs, intersections)
+        )
 
     def chain(db, executor):
         rad = 0
         if tr.area > 0:
             if with_shadows:
-                get_intersections = lambda tv: query_intersections(db, tr.geom, tv[1])
-                for (ti, sunvec), row_intersect in zip(
-                    time_and_vec,
-                    executor.map(get_intersections, time_and_vec, timeout=TIMEOUT),
-                ):
-                    exposed_area = get_exposed_area(tr, sunvec, row_intersect)
-                    rad += compute_radiation(exposed_area, ti, tr)
+                lit = [(sunvec, direct) for _, sunvec, is_lit, _, direct in hours if is_lit]
+                shadow_counter.computed += len(lit)
+                shadow_counter.skipped += len(hours) - len(lit)
+                exposures = get_exposures(db, executor, [sunvec for sunvec, _ in lit])
+                rad += sum(diffuse for _, _, _, diffuse, _ in hours) * sample_rate
+                # the TMY may give direct irradiance with the sun under a
+                # degree or just behind the triangle
+                rad += (
+                    sum(direct for _, _, is_lit, _, direct in hours if not is_lit)
+                    * sample_rate
+                )
+                for (_, direct), exposed_area in zip(lit, exposures):
+                    rad += exposed_area * direct * sample_rate
 
             else:
                 for ti in day:
@@ -181,7 +752,7 @@ def make_task(day, tr):
     return chain
 
 
-def process_tasks(roof_geometry, db, executor):
+def process_tasks(roof_id, roof_geometry, db, executor):
     triangles = []
     days = generate_sample_days(sample_rate)
     # tesselated = []
@@ -202,18 +773,128 @@ def process_tasks(roof_geometry, db, executor):
             )
         )
 
-    tasks = [make_task(day, tr) for day, tr in it.product(days, triangles)]
+    if with_shadows and exposure_mode == "horizon":
+        horizons = get_roof_horizons(roof_id, triangles)
+        if horizon_rdiso:
+            skies = [sky_visibility(horizon) for horizon in horizons]
+        else:
+            skies = [None] * len(horizons)
+        tasks = [
+            make_task(day, tr, horizon, sky=sky)
+            for day, (tr, horizon, sky) in it.product(
+                days, zip(triangles, horizons, skies)
+            )
+        ]
+    elif with_shadows and shadow_engine == "prefetch":
+        index = prefetch_roof_solids(db, triangles)
+        tasks = [
+            make_task(day, tr, index=index) for day, tr in it.product(days, triangles)
+        ]
+    elif with_shadows and shadow_engine == "async":
+        pending = AsyncIntersections()
+        tasks = [
+            make_task(day, tr, pending=pending)
+            for day, tr in it.product(days, triangles)
+        ]
+    elif with_shadows and shadow_engine == "postgis" and sweep_mode == "run":
+        sweeps = [SweepCandidates(tr.geom) for tr in triangles]
+        tasks = [
+            make_task(day, tr, sweep=sweep)
+            for day, (tr, sweep) in it.product(days, zip(triangles, sweeps))
+        ]
+    elif with_shadows and shadow_engine == "postgis" and sweep_mode == "day":
+        tasks = [
+            make_task(day, tr, sweep=SweepCandidates(tr.geom))
+            for day, tr in it.product(days, triangles)
+        ]
+    else:
+        tasks = [make_task(day, tr) for day, tr in it.product(days, triangles)]
 
     return sum(map(lambda t: t(db, executor), tasks)) / n
 
 
+_roof_count = 0
+
+
+def log_cache_stats():
+    """log cache and shadow counters of this process every cache_log_interval roofs"""
+    global _roof_count
+    _roof_count += 1
+    if cache_log_interval > 0 and _roof_count % cache_log_interval == 0:
+        stats = intersect_cache.stats()
+        logger.info(
+            "IntersectCache [{}] after {} roofs: {}".format(
+                os.getpid(),
+                _roof_count,
+                ", ".join("{}={}".format(k, v) for k, v in stats.items()),
+            )
+        )
+        logger.info(
+            "Shadow hours [{}] after {} roofs: computed={}, skipped={}".format(
+                os.getpid(),
+                _roof_count,
+                shadow_counter.computed,
+                shadow_counter.skipped,
+            )
+        )
+        for alias, stats in balancer_stats().items():
+            logger.info(
+                "Replica [{}] {} after {} roofs: {}".format(
+                    os.getpid(),
+                    alias,
+                    _roof_count,
+                    ", ".join("{}={}".format(k, v) for k, v in stats.items()),
+                )
+            )
+        for alias, stats in pool_stats().items():
+            logger.info(
+                "ConnectionPool [{}] {} after {} roofs: {}".format(
+                    os.getpid(),
+                    alias,
+                    _roof_count,
+                    ", ".join("{}={}".format(k, v) for k, v in stats.items()),
+                )
+            )
+        if _async_engine is not None:
+            logger.info(
+                "AsyncQueryEngine [{}] after {} roofs: {}".format(
+                    os.getpid(),
+                    _roof_count,
+                    ", ".join(
+                        "{}={}".format(k, v) for k, v in _async_engine.stats().items()
+                    ),
+                )
+            )
+        if sun_cache is not None:
+            logger.info(
+                "SunCache [{}] after {} roofs: {}".format(
+                    os.getpid(),
+                    _roof_count,
+                    ", ".join(
+                        "{}={}".format(k, v) for k, v in sun_cache.stats().items()
+                    ),
+                )
+            )
+
+
 def compute_radiation_roof(node_name, row):
+    log_cache_stats()
     id = row[0]
     geom = row[1]
     area = get_roof_area(geom)
     start_time = now()
-    db = Data(settings.SOLAR_CONNECTION, settings.SOLAR_TABLES, reset=True)
-    res = Data(settings.SOLAR_CONNECTION_RESULTS, settings.SOLAR_TABLES, reset=True)
+    db = Data(
+        settings.SOLAR_CONNECTION,
+        settings.SOLAR_TABLES,
+        reset=True,
+        prepared=prepared_queries,
+    )
+    res = Data(
+        settings.SOLAR_CONNECTION_RESULTS,
+        settings.SOLAR_TABLES,
+        reset=True,
+        prepared=prepared_queries,
+    )
     res.exec(
         "insert_result",
         (0.0, area, node_name, STATUS_PENDING, start_time, start_time, id),
@@ -221,7 +902,7 @@ def compute_radiation_roof(node_name, row):
     try:
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
             logger.info(f'Starting {id}')
-            total_rad = process_tasks(geom, db, executor)
+            total_rad = process_tasks(id, geom, db, executor)
 
         res.exec(
             "insert_result",
@@ -236,7 +917,7 @@ def compute_radiation_roof(node_name, row):
         )
         print(traceback.format_exc())
     except Exception as ex:
-        logger.error("Exception in compute_radiation_roof [{id}]: {}".format(id,ex))
+        logger.error("Exception in compute_radiation_roof [{}]: {}".format(id, ex))
         res.exec(
             "insert_result",
             (0.0, area, node_name, STATUS_FAILED, start_time, now(), id),
@@ -244,28 +925,80 @@ def compute_radiation_roof(node_name, row):
         print(traceback.format_exc())
 
 
-def compute_batches(node_name, batch_size):
+def init_worker(shared_handle, worker_pool_size):
+    use_balancer(connection_policy, eject_failures, eject_time)
+    if shared_handle is not None:
+        intersect_cache.attach(SharedSolidCache.attach(shared_handle))
+    if worker_pool_size > 0:
+        use_pools(worker_pool_size, pool_timeout)
 
-    with ProcessPoolExecutor() as executor:
-        while True:
-            db = Data(
-                settings.SOLAR_CONNECTION_RESULTS,
-                settings.SOLAR_TABLES,
-                reset=True,
-            )
 
-            rows = list(rows_with_geom(db, "select_result_batch", (batch_size,), 1))
+def compute_batches(node_name, batch_size):
+    if shadow_engine == "async" and not async_available():
+        raise ImproperlyConfigured('SOLAR_SHADOW_ENGINE "async" needs asyncpg')
+    workers = os.cpu_count() or 1
+    # the node budget of connections per database is split among workers
+    worker_pool_size = max(1, pool_size // workers) if pool_size > 0 else 0
+    # computed before forking workers, which then share them
+    get_sky_state([])
+    if shared_cache_size > 0:
+        with Manager() as manager:
+            shared = SharedSolidCache.create(shared_cache_size, manager)
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=init_worker,
+                    initargs=(shared.handle(), worker_pool_size),
+                ) as executor:
+                    run_batches(node_name, batch_size, executor, workers)
+                logger.info(f"Shared solid cache used {shared.used()} bytes")
+            finally:
+                shared.unlink()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(None, worker_pool_size),
+        ) as executor:
+            run_batches(node_name, batch_size, executor, workers)
+
+
+def batch_chunksize(n_rows, workers):
+    """
+    With spatially ordered batches, hand each worker contiguous runs of
+    neighbouring roofs (two runs per worker to even out the load), so that
+    they share its caches.
+    """
+    if batch_order == "spatial":
+        return max(1, math.ceil(n_rows / (workers * 2)))
+    return 4
+
+
+def run_batches(node_name, batch_size, executor, workers):
+    select_batch = (
+        "select_result_batch_spatial"
+        if batch_order == "spatial"
+        else "select_result_batch"
+    )
+    while True:
+        db = Data(
+            settings.SOLAR_CONNECTION_RESULTS,
+            settings.SOLAR_TABLES,
+            reset=True,
+        )
+
+        rows = list(rows_with_geom(db, select_batch, (batch_size,), 1))
 
-            if 0 == len(rows):
-                break
+        if 0 == len(rows):
+            break
 
-            rows_id = [str(row[0]) for row in rows]
+        rows_id = [str(row[0]) for row in rows]
 
-            db.exec("insert_result_reservation", (node_name, STATUS_ACK, rows_id))
+        db.exec("insert_result_reservation", (node_name, STATUS_ACK, rows_id))
 
-            for _ in executor.map(
-                partial(compute_radiation_roof, node_name),
-                rows,
-                chunksize=4,
-            ):
-                pass
+        for _ in executor.map(
+            partial(compute_radiation_roof, node_name),
+            rows,
+            chunksize=batch_chunksize(len(rows), workers),
+        ):
+            pass
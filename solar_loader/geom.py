@@ -149,6 +149,34 @@ def transform_multipolygon(m, mpoly):
     return geometry.MultiPolygon(map(partial(transform_polygon, m), mpoly))
 
 
+def transform_triangles(m, tris):
+    """
+    m    -- a 4x4 transformation matrix
+    tris -- (n, 3, 3) array of triangles
+
+    returns transformed triangles as a (n, 3, 3) array
+    """
+    return tris @ m[:3, :3] + m[3, :3]
+
+
+def polygons_to_array(polygons):
+    """
+    polygons -- a list of triangular shapely.geometry.Polygon
+
+    returns a (n, 3, 3) array of triangles
+    """
+    if len(polygons) == 0:
+        return np.zeros((0, 3, 3))
+    return np.array([p.exterior.coords[:3] for p in polygons], dtype=float)
+
+
+def as_triangle_array(solid):
+    """a solid as a (n, 3, 3) array, be it a list of polygons or an array"""
+    if isinstance(solid, np.ndarray):
+        return solid
+    return polygons_to_array(list(solid))
+
+
 def polygon_drop_z(poly):
     return geometry.Polygon([coord[:2] for coord in poly.exterior.coords])
 
@@ -244,6 +272,73 @@ def ctor_polygon(a, b, c):
 
 
 
+def sample_triangle(t, k):
+    """
+    Stratified samples on a Triangle t: the triangle is split in k * k
+    triangles of equal area, and the centers of these are returned as
+    a (k * k, 3) array
+    """
+    bary = []
+    for i in range(k):
+        for j in range(k - i):
+            bary.append((i + 1 / 3, j + 1 / 3))
+            if i + j < k - 1:
+                bary.append((i + 2 / 3, j + 2 / 3))
+    bary = np.array(bary) / k
+    a = np.asarray(t.a, dtype=float)
+    ab = np.asarray(t.b, dtype=float) - a
+    ac = np.asarray(t.c, dtype=float) - a
+    return a + np.outer(bary[:, 0], ab) + np.outer(bary[:, 1], ac)
+
+
+RAY_EPSILON = 1e-9
+RAY_CHUNK = 2**20
+
+
+def intersect_rays_triangles(origins, direction, tris, t_min=0.0):
+    """
+    Möller–Trumbore ray/triangle intersection, for rays sharing a
+    direction against a set of triangles.
+
+    origins   -- (p, 3) array
+    direction -- a 3d vector
+    tris      -- (m, 3, 3) array
+    t_min     -- hits closer than this distance along direction are ignored
+
+    returns a boolean array of length p, True where a ray hits any triangle
+    """
+    origins = np.asarray(origins, dtype=float)
+    direction = np.asarray(direction, dtype=float)
+    blocked = np.zeros(len(origins), dtype=bool)
+    if len(tris) == 0 or len(origins) == 0:
+        return blocked
+
+    v0 = tris[:, 0]
+    e1 = tris[:, 1] - v0
+    e2 = tris[:, 2] - v0
+    pvec = np.cross(direction, e2)
+    det = np.einsum('md,md->m', e1, pvec)
+    keep = np.abs(det) > RAY_EPSILON
+    v0, e1, e2, pvec, det = v0[keep], e1[keep], e2[keep], pvec[keep], det[keep]
+    inv_det = 1.0 / det
+
+    step = max(1, RAY_CHUNK // len(origins))
+    for s in range(0, len(v0), step):
+        e = slice(s, s + step)
+        open_rays = np.flatnonzero(~blocked)
+        if len(open_rays) == 0:
+            break
+        tvec = origins[open_rays, None, :] - v0[None, e]
+        u = np.einsum('pmd,md->pm', tvec, pvec[e]) * inv_det[e]
+        qvec = np.cross(tvec, e1[e])
+        v = (qvec @ direction) * inv_det[e]
+        t = np.einsum('pmd,md->pm', qvec, e2[e]) * inv_det[e]
+        hit = (u >= 0) & (v >= 0) & (u + v <= 1) & (t > t_min)
+        blocked[open_rays] = np.any(hit, axis=1)
+
+    return blocked
+
+
 # from https://stackoverflow.com/questions/2827393/angles-between-two-n-dimensional-vectors-in-python/13849249#13849249
 def angle_between(v1, v2):
     """ Returns the angle in radians between vectors 'v1' and 'v2'"""
@@ -0,0 +1,161 @@
+"""
+Horizon maps of triangles.
+
+For a few points on a triangle (its vertices pulled towards its center, and
+its center) we record, for each azimuth bin, the highest elevation of the
+surrounding solids. Sun visibility at any time is then a lookup in this map
+instead of a shadow computation.
+"""
+
+import logging
+import os
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HORIZON_BINS = 360
+# vertices are moved towards the center of the triangle by this rate,
+# to keep them off walls the triangle might touch
+VERTEX_PULL = 0.1
+MAX_EDGE_SAMPLES = 4096
+
+
+def triangle_points(t):
+    """returns a (4, 3) array of points to compute horizons for"""
+    vertices = np.array([t.a, t.b, t.c], dtype=float)
+    center = vertices.mean(axis=0)
+    pulled = vertices + (center - vertices) * VERTEX_PULL
+    return np.concatenate([pulled, [center]])
+
+
+def azimuth_elevation(vecs):
+    """
+    vecs -- (..., 3) array of directions
+
+    returns azimuths (degrees clockwise from north, in [0, 360)) and
+    elevations (degrees)
+    """
+    vecs = np.asarray(vecs, dtype=float)
+    horizontal = np.hypot(vecs[..., 0], vecs[..., 1])
+    azimuth = np.rad2deg(np.arctan2(vecs[..., 0], vecs[..., 1])) % 360.0
+    elevation = np.rad2deg(np.arctan2(vecs[..., 2], horizontal))
+    return azimuth, elevation
+
+
+def _edge_samples(point, tris, bin_rad, near):
+    """
+    Sample edges of tris densely enough for each sample to be within an
+    azimuth bin of its neighbours as seen from point.
+    """
+    starts = tris.reshape(-1, 3)
+    ends = np.roll(tris, -1, axis=1).reshape(-1, 3)
+    edges = ends - starts
+    # azimuths only depend on the horizontal part of edges, and the
+    # distance from point to their closest point on the ground plane
+    flat = edges[:, :2]
+    flat_lengths = np.linalg.norm(flat, axis=1)
+    along = np.clip(
+        np.einsum('ed,ed->e', point[:2] - starts[:, :2], flat) /
+        np.maximum(flat_lengths**2, 1e-12), 0, 1)
+    closest = starts[:, :2] + flat * along[:, None]
+    dists = np.maximum(np.linalg.norm(closest - point[:2], axis=1), near)
+    counts = np.clip(np.ceil(2 * flat_lengths / (dists * bin_rad)), 1,
+                     MAX_EDGE_SAMPLES).astype(int) + 1
+    edge_index = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.cumsum(counts) - counts
+    steps = np.arange(len(edge_index)) - np.repeat(offsets, counts)
+    t = steps / np.repeat(counts - 1, counts)
+    return starts[edge_index] + edges[edge_index] * t[:, None]
+
+
+def compute_horizon(points, tris, bins=HORIZON_BINS, near=1.0, far=200.0):
+    """
+    points -- (p, 3) array
+    tris   -- (m, 3, 3) array of triangles of surrounding solids
+    near   -- parts of solids closer than this are ignored
+    far    -- parts of solids further than this are ignored
+
+    returns a (p, bins) array of horizon elevations in degrees, -90 where
+    nothing stands
+    """
+    points = np.asarray(points, dtype=float)
+    horizon = np.full((len(points), bins), -90.0)
+    if len(tris) == 0:
+        return horizon
+
+    bin_rad = 2 * np.pi / bins
+    for i, point in enumerate(points):
+        samples = _edge_samples(point, tris, bin_rad, near) - point
+        dists = np.linalg.norm(samples, axis=1)
+        keep = (dists >= near) & (dists <= far)
+        azimuth, elevation = azimuth_elevation(samples[keep])
+        index = (azimuth * bins / 360.0).astype(int) % bins
+        np.maximum.at(horizon[i], index, elevation)
+
+    return horizon
+
+
+def sun_visibility(horizon, sunvec):
+    """
+    horizon -- (p, bins) array as returned by compute_horizon
+    sunvec  -- a vector pointing towards the sun
+
+    returns the share of points that see the sun
+    """
+    azimuth, elevation = azimuth_elevation(sunvec)
+    bins = horizon.shape[-1]
+    index = int(azimuth * bins / 360.0) % bins
+    return np.count_nonzero(horizon[:, index] < elevation) / len(horizon)
+
+
+def sky_visibility(horizon):
+    """
+    horizon -- (p, bins) array as returned by compute_horizon
+
+    returns a (360, 90) array of the share of points that see each sky
+    element, by azimuth and zenith angle in degrees, as expected by
+    radiation.roof_rdiso_array
+    """
+    bins = horizon.shape[-1]
+    index = (np.arange(360) * bins // 360)
+    elevation = 90.0 - (np.arange(90) + 0.5)
+    visible = elevation[None, None, :] > horizon[:, index, None]
+    return visible.mean(axis=0)
+
+
+class HorizonStore:
+    """
+    Keep horizon maps of roofs in a directory, one file per roof id,
+    with the triangles they were computed for.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, roof_id):
+        return self.path.joinpath('{}.npz'.format(roof_id))
+
+    def get(self, roof_id, triangles, bins):
+        """returns stored horizons if they match triangles, or None"""
+        f = self._file(roof_id)
+        if not f.exists():
+            return None
+        try:
+            with np.load(f.as_posix()) as data:
+                if (data['horizons'].shape[-1] == bins
+                        and data['triangles'].shape == triangles.shape
+                        and np.allclose(data['triangles'], triangles)):
+                    return data['horizons']
+        except Exception as ex:
+            logger.error('HorizonStore could not read {}: {}'.format(f, ex))
+        return None
+
+    def put(self, roof_id, triangles, horizons):
+        f = self._file(roof_id)
+        # workers computing the same roof each write a file of their own
+        tmp = f.with_suffix('.{}.tmp.npz'.format(os.getpid()))
+        np.savez(tmp.as_posix(), triangles=triangles,
+                 horizons=horizons.astype(np.float32))
+        tmp.replace(f)
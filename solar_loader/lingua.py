@@ -1,18 +1,31 @@
 import math
 import logging
+import struct
 import numpy as np
-from shapely import geometry, wkt
+import shapely
+from shapely import geometry, wkb, wkt
 from .geom import tesselate, angle_between, get_triangle_center
 from .records import Triangle
 
 logger = logging.getLogger(__name__)
 
 
-def rows_with_geom(db, select, params, geom_index):
-    for row in db.rows(select, {}, params):
+WKB_POLYGON_Z = 1003
+WKB_POLYHEDRALSURFACE_Z = 1015
+
+
+def load_geom(value):
+    """reads a geometry returned as WKT text or as WKB bytes"""
+    if isinstance(value, (bytes, memoryview)):
+        return wkb.loads(bytes(value))
+    return wkt.loads(value)
+
+
+def rows_with_geom(db, select, params, geom_index, strict=False):
+    for row in db.rows(select, {}, params, strict):
         row = list(row)
         try:
-            row[geom_index] = wkt.loads(row[geom_index])
+            row[geom_index] = load_geom(row[geom_index])
         except Exception as ex:
             logger.error('[{}] could not read "{}"\n{}'.format(select, row[geom_index], ex))
             continue
@@ -81,6 +94,29 @@ def make_polyhedral(t0, t1):
         ', '.join(hs))
 
 
+def face_to_wkb(points):
+    ring = np.array(list(points) + [points[0]], dtype='<f8')
+    return struct.pack('<BIII', 1, WKB_POLYGON_Z, 1, len(ring)) + \
+        ring.tobytes()
+
+
+def make_polyhedral_wkb(t0, t1):
+    """
+    the same surface as make_polyhedral, as ISO WKB bytes to be bound to
+    a ST_GeomFromWKB parameter
+    """
+    faces = [
+        (t0.a, t0.b, t0.c),
+        (t0.a, t1.a, t1.b, t0.b),
+        (t0.b, t1.b, t1.c, t0.c),
+        (t0.c, t1.c, t1.a, t0.a),
+        (t1.a, t1.c, t1.b),
+    ]
+    return b''.join(
+        [struct.pack('<BII', 1, WKB_POLYHEDRALSURFACE_Z, len(faces))] +
+        [face_to_wkb(face) for face in faces])
+
+
 def make_polygon(t0, t1):
     hs = [
         triangle_to_wkt(t0.a, t0.b, t0.c),
@@ -93,12 +129,41 @@ def make_polygon(t0, t1):
     return 'ST_GeomFromText(\'MULTIPOLYGON Z({})\', 31370)'.format(
         ', '.join(hs))
 
+def footprint_hull(points):
+    """
+    points -- an iterable of 3d coordinates
+
+    returns the 2D convex hull of points
+    """
+    return geometry.MultiPoint([(p[0], p[1]) for p in points]).convex_hull
+
+
+def make_footprint_hull(points):
+    """
+    points -- an iterable of 3d coordinates
+
+    returns the 2D convex hull of points as a SQL expression
+    """
+    return 'ST_GeomFromText(\'{}\', 31370)'.format(
+        wkt.dumps(footprint_hull(points), rounding_precision=2))
+
+
+def make_footprint_hull_wkb(points):
+    """the 2D convex hull of points as ISO WKB bytes"""
+    return shapely.to_wkb(footprint_hull(points), flavor='iso')
+
+
 def make_point_from_center(triangle):
     p = get_triangle_center(triangle)
     return 'ST_GeomFromText(\'POINT Z({:.2f} {:.2f} {:.2f})\', 31370)'.format(
         *p)
 
 
+def make_point_wkb(p):
+    """a 3d point as ISO WKB bytes"""
+    return shapely.to_wkb(geometry.Point(*p), flavor='iso')
+
+
 NOON = [0, 1]
 
 
@@ -0,0 +1,47 @@
+#  Copyright (C) 2018 Atelier Cartographique <contact@atelier-cartographique.be>
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, version 3 of the License.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from solar_loader.cube import build_cube
+from solar_loader.time import brussels_zone
+from solar_loader.tmy import TMY
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            help='Where to save the cube, defaults to SOLAR_IRRADIANCE_CUBE',
+        )
+        parser.add_argument(
+            '-y',
+            '--year',
+            dest='year',
+            type=int,
+            default=datetime.now(brussels_zone).year,
+            help='Year of the runs using the cube, defaults to this year',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or getattr(settings, 'SOLAR_IRRADIANCE_CUBE',
+                                          None)
+        if path is None:
+            raise CommandError('No path given for the irradiance cube')
+        build_cube(TMY(settings.SOLAR_TMY),
+                   getattr(settings, 'SOLAR_SAMPLE_RATE', 14), path,
+                   options['year'])
@@ -20,9 +20,17 @@ from solar_loader.store import Data
 
 class Command(BaseCommand):
     def add_arguments(self, parser):
-        pass
+        parser.add_argument(
+            '--spatial-key',
+            dest='spatial_key',
+            action='store_true',
+            help='Only add spatial keys to an existing results table',
+        )
 
     def handle(self, *args, **options):
         data_store = Data(settings.SOLAR_CONNECTION_RESULTS,
                           settings.SOLAR_TABLES)
-        data_store.exec('create_result')
+        if options['spatial_key']:
+            data_store.exec('update_result_spatial_key')
+        else:
+            data_store.exec('create_result')
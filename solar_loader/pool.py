@@ -0,0 +1,167 @@
+"""
+Bounded pools of database connections.
+
+A pool holds at most `size` psycopg2 connections to one database, shared
+by the threads of a process and kept open across roofs. Threads asking
+for a connection while all of them are in use wait for one to be given
+back, and the time they waited is recorded so that pools (and the
+max_connections of servers) can be sized from actual contention.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from time import monotonic, perf_counter
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# seconds a connection may stay idle before it is checked on checkout
+CHECK_INTERVAL = 30
+
+
+class PoolTimeout(Exception):
+    def __init__(self, name, timeout):
+        self.message = 'No connection to "{}" within {} seconds'.format(
+            name, timeout)
+        super().__init__(self.message)
+
+
+class PooledConnection:
+    """
+    A psycopg2 connection of a pool, offering the `cursor()` and
+    `connection` of a Django connection to store.Data
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.last_used = monotonic()
+
+    def cursor(self):
+        return self.connection.cursor()
+
+    def is_usable(self):
+        try:
+            with self.connection.cursor() as cur:
+                cur.execute('SELECT 1')
+            return True
+        except psycopg2.Error:
+            return False
+
+    def close(self):
+        try:
+            self.connection.close()
+        except psycopg2.Error:
+            pass
+
+
+class ConnectionPool:
+    def __init__(self, name, connect, size, timeout=None,
+                 check_interval=CHECK_INTERVAL):
+        """
+        name    -- a name for logs, such as the database alias
+        connect -- a function returning a new psycopg2 connection
+        size    -- maximum number of open connections
+        timeout -- seconds to wait for a connection before raising
+                   PoolTimeout, None to wait for ever
+        """
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._connect = connect
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []
+        self.opened = 0
+        self.closed = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _open(self):
+        conn = self._connect()
+        conn.autocommit = True
+        with self._lock:
+            self.opened += 1
+        return PooledConnection(conn)
+
+    def _discard(self, conn):
+        conn.close()
+        with self._lock:
+            self.closed += 1
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if len(self._idle) > 0 else None
+            if conn is None:
+                return self._open()
+            if conn.connection.closed:
+                self._discard(conn)
+            elif (monotonic() - conn.last_used > self.check_interval
+                  and not conn.is_usable()):
+                logger.warning('ConnectionPool "{}" dropped a dead connection'
+                               .format(self.name))
+                self._discard(conn)
+            else:
+                return conn
+
+    def _checkin(self, conn, failed):
+        broken = conn.connection.closed or (
+            failed and conn.connection.get_transaction_status() !=
+            psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+        if broken:
+            self._discard(conn)
+            return
+        conn.last_used = monotonic()
+        with self._lock:
+            self._idle.append(conn)
+
+    @contextmanager
+    def connection(self):
+        """a connection of the pool, for the duration of the block"""
+        start = perf_counter()
+        if not self._slots.acquire(blocking=False):
+            if not self._slots.acquire(timeout=self.timeout):
+                raise PoolTimeout(self.name, self.timeout)
+            waited = perf_counter() - start
+            with self._lock:
+                self.waits += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+        try:
+            conn = self._checkout()
+            with self._lock:
+                self.checkouts += 1
+            failed = False
+            try:
+                yield conn
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                self._checkin(conn, failed)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                size=self.size,
+                open=self.opened - self.closed,
+                idle=len(self._idle),
+                checkouts=self.checkouts,
+                waits=self.waits,
+                wait_time=round(self.wait_time, 3),
+                max_wait=round(self.max_wait, 3),
+                mean_wait=round(self.wait_time / self.waits, 4)
+                if self.waits > 0 else 0.0,
+            )
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
@@ -156,6 +156,148 @@ def compute_gk(gh,
     return max(0, gk), max(0, bk)
 
 
+# surface independent terms of the Perez model, per hour
+SKY_STATE_DTYPE = np.dtype([
+    ('gh', float),
+    ('dh', float),
+    ('bh', float),
+    ('sza', float),  # [rad], at most 89 degrees
+    ('saa', float),  # [rad], 0 to 2 pi
+    ('f1', float),
+    ('f2', float),
+])
+
+
+def sky_state(gh, dh, sza, saa, alt, month, i):
+    """
+    compute the part of compute_gk that does not depend on the surface,
+    for arrays of hours.
+
+    Arguments are those of compute_gk, as arrays that broadcast together.
+
+    Returns a structured array of SKY_STATE_DTYPE, to be given to
+    surface_gk.
+    """
+    gh, dh, sza, saa = (np.asarray(a, dtype=float)
+                        for a in (gh, dh, sza, saa))
+    shape = np.broadcast_shapes(gh.shape, dh.shape, sza.shape, saa.shape,
+                                np.shape(month), np.shape(i))
+
+    # day of year:
+    dayofyear = 1 + days_in_months_before[np.asarray(month, dtype=int) -
+                                          1] + np.floor(np.asarray(i) / 24.0)
+
+    # calculate direct horizontal irradiance bh
+    bh = np.minimum(gh - dh, 0.95 * gh)
+
+    # convert azimuth from TMY (-180 to 180) to 0-360, make sure that sun is
+    # above horizon and convert angels to [rad]
+    saa = np.radians(saa + 180)
+    sza = np.radians(np.minimum(89, sza))
+
+    # calculate PEREZ MODEL parameter delta
+    hs = (pi / 2.0) - sza
+    am = airmass_array(hs, alt)
+    i0 = 1367 * (1 + 0.03344 * np.cos(2 * pi * dayofyear / 365.25 - 0.048869))
+    delta = dh * am / i0
+
+    # calculate PEREZ MODEL parameter epsilon, a null dh gives the last bin
+    with np.errstate(divide='ignore', invalid='ignore'):
+        epsilon = (1.0 + bh / (dh * np.sin(hs)) + 1.041 *
+                   (sza**3)) / (1.0 + 1.041 * (sza**3))
+    epsilon = np.where(np.isnan(epsilon), np.inf, epsilon)
+
+    # CIRCUMSOLAR AND HORIZON BRIGHTENING COEFFICIENTS F1 and F2
+    eps = np.searchsorted(epsilons[:7], epsilon, side='right')
+
+    state = np.empty(shape, dtype=SKY_STATE_DTYPE)
+    state['gh'] = gh
+    state['dh'] = dh
+    state['bh'] = bh
+    state['sza'] = sza
+    state['saa'] = saa
+    state['f1'] = f1[0, eps] + f1[1, eps] * delta + f1[2, eps] * sza
+    state['f2'] = f2[0, eps] + f2[1, eps] * delta + f2[2, eps] * sza
+    return state
+
+
+def surface_gk(state,
+               alb,
+               azimuth,
+               inclination,
+               visibility,
+               rdiso_flat,
+               rdiso):
+    """
+    compute irradiation on inclined surfaces from a sky state.
+
+    state -- a structured array returned by sky_state
+    other arguments are those of compute_gk, as arrays that broadcast with
+    state
+
+    Returns global (=gk) and direct (=bk) irradiance (W/m2) arrays.
+    """
+    gh, dh, bh, sza, saa, f1_coeff, f2_coeff = (state[k] for k in (
+        'gh', 'dh', 'bh', 'sza', 'saa', 'f1', 'f2'))
+    alb = np.minimum(alb, 1)
+    azimuth = np.radians(azimuth)
+    inclination = np.radians(inclination)
+
+    cos_theta_gen = np.maximum(
+        0,
+        np.sin(sza) * np.sin(inclination) * np.cos(saa - azimuth) +
+        np.cos(sza) * np.cos(inclination))
+
+    gh_hor = ((visibility * (bh + dh * f1_coeff) + dh *
+               (1 - f1_coeff) * rdiso_flat) / (1 - (1 - rdiso_flat) * alb))
+
+    bk = visibility * bh * cos_theta_gen / np.cos(sza)
+    dif_cs = visibility * dh * f1_coeff * cos_theta_gen / np.maximum(
+        0.087, np.cos(sza))
+    dif_ref = gh_hor * alb * (1 - rdiso)
+    dif_iso = dh * (1 - f1_coeff) * rdiso
+    dif_horrib = dh * f2_coeff * np.sin(inclination)
+    gk = bk + dif_cs + dif_ref + dif_iso + dif_horrib
+
+    night = gh <= 0
+    return (np.where(night, 0.0, np.maximum(0, gk)),
+            np.where(night, 0.0, np.maximum(0, bk)))
+
+
+def compute_gk_array(gh,
+                     dh,
+                     sza,
+                     saa,
+                     alb,
+                     azimuth,
+                     inclination,
+                     alt,
+                     visibility,
+                     month,
+                     i,
+                     rdiso_flat=None,
+                     rdiso=None):
+    """
+    compute irradiation on inclined surfaces, as compute_gk does, for
+    arrays of inputs.
+
+    All arguments of compute_gk are accepted as numpy arrays (or scalars)
+    that broadcast together.
+
+    Returns global (=gk) and direct (=bk) irradiance (W/m2) arrays.
+    """
+    azimuth, inclination, visibility = (
+        np.asarray(a, dtype=float)
+        for a in (azimuth, inclination, visibility))
+
+    if rdiso_flat is None or rdiso is None:
+        rdiso_flat, rdiso = np.vectorize(roof_rdiso)(azimuth, inclination,
+                                                     visibility)
+
+    return surface_gk(sky_state(gh, dh, sza, saa, alt, month, i), alb,
+                      azimuth, inclination, visibility, rdiso_flat, rdiso)
+
+
 # constants for computing roof_rdiso
 PI_DIV_90_360 = pi / (90 * 360)
 
@@ -192,6 +334,44 @@ def roof_rdiso(azimuth, inclination, visibility):
     return max(0.0, min(1.0, rdiso_flat)), max(0.0, min(1.0, rdiso))
 
 
+# sky elements of roof_rdiso, by azimuth (phi) and zenith angle (theta) of
+# their centers
+SKY_PHI = np.radians(np.arange(0, 360))
+SKY_THETA = np.radians(np.arange(0, 90) + 0.5)
+
+
+def roof_rdiso_array(azimuth, inclination, visibility=1):
+    """
+    calculates the isotropic diffus view factors as roof_rdiso does, with
+    numpy over the grid of sky elements.
+
+    azimuth and inclination can be arrays that broadcast together;
+    visibility is either a scalar or an array of shape (..., 360, 90)
+    giving the visibility of each sky element, indexed by azimuth and
+    zenith angle in degrees.
+
+    returns rdiso for flat plane and inclined plane
+    """
+    azimuth = np.radians(np.asarray(azimuth, dtype=float))[..., None, None]
+    inclination = np.radians(np.asarray(inclination,
+                                        dtype=float))[..., None, None]
+    sin_theta = np.sin(SKY_THETA)
+    cos_theta = np.cos(SKY_THETA)
+    visibility = np.asarray(visibility, dtype=float)
+    visibility = np.broadcast_to(
+        visibility, np.broadcast_shapes(visibility.shape, (360, 90)))
+    weight = PI_DIV_90_360 * sin_theta * visibility
+
+    incidence = np.maximum(
+        sin_theta * np.sin(inclination) *
+        np.cos(SKY_PHI[:, None] - azimuth) + cos_theta * np.cos(inclination),
+        0)
+    rdiso = np.sum(weight * incidence, axis=(-2, -1))
+    rdiso_flat = np.broadcast_to(np.sum(weight * cos_theta, axis=(-2, -1)),
+                                 rdiso.shape)
+    return np.clip(rdiso_flat, 0.0, 1.0), np.clip(rdiso, 0.0, 1.0)
+
+
 # constants for computingairmass
 AIRMASS_HST_4_NEG_HS = 0.061359 * 0.1594
 AIRMASS_DIVIDER_4_NEG_HS = (sin(AIRMASS_HST_4_NEG_HS) + 0.50572 *
@@ -211,3 +391,16 @@ def airmass(hs, alt):
             1 + 28.9344 * hs + 277.3971 * hs**2)
         airmass = alt_corr / (sin(hst) + 0.50572 * (hst + 6.07995)**-1.6364)
     return airmass
+
+
+def airmass_array(hs, alt):
+    """airmass for an array of sun heights"""
+    hs = np.asarray(hs, dtype=float)
+    alt_corr = np.exp(-np.asarray(alt, dtype=float) / 8435.2)
+    hst = hs + 0.061359 * (0.1594 + 1.123 * hs + 0.065656 * hs**2) / (
+        1 + 28.9344 * hs + 277.3971 * hs**2)
+    return np.where(
+        hs < 0,
+        alt_corr / AIRMASS_DIVIDER_4_NEG_HS,
+        alt_corr / (np.sin(hst) + 0.50572 * (hst + 6.07995)**-1.6364),
+    )
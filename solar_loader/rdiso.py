@@ -1,9 +1,7 @@
-from .records import RdisoKey, RdisoValue
+import numpy as np
+from .records import RdisoValue
 
 
-def make_dict(data):
-    return {RdisoKey(r[0], r[1]): RdisoValue(r[2], r[3]) for r in data}
-
 rdiso_data5 = [
 # azimuth, tilt, rdiso_flat, rdiso
 (0, 0, 1.0, 1.0),
@@ -1399,13 +1397,57 @@ rdiso_data5 = [
 
 
 
-rdiso5 = make_dict(rdiso_data5)
+STEP = 5
+AZIMUTHS = 73
+TILTS = 19
+
+
+def make_table(data):
+    """
+    A dense (azimuth, tilt, 2) array of rdiso_flat and rdiso, indexed by
+    azimuth and tilt divided by STEP.
+    """
+    table = np.full((AZIMUTHS, TILTS, 2), np.nan)
+    for azimuth, tilt, rdiso_flat, rdiso in data:
+        table[azimuth // STEP, tilt // STEP] = rdiso_flat, rdiso
+    return table
+
+
+rdiso_table = make_table(rdiso_data5)
+
 
 class RDIsoError(Exception):
     pass
 
+
 def get_rdiso5(azimuth, tilt):
-    r = rdiso5.get(RdisoKey(azimuth, tilt), None)
-    if r is None:
+    """rdiso values of an orientation of the 5 degrees grid"""
+    a, t = divmod(azimuth, STEP), divmod(tilt, STEP)
+    if a[1] != 0 or t[1] != 0 or not (0 <= a[0] < AZIMUTHS
+                                      and 0 <= t[0] < TILTS):
         raise RDIsoError('{}/{}'.format(azimuth, tilt))
-    return r
\ No newline at end of file
+    return RdisoValue(*rdiso_table[int(a[0]), int(t[0])])
+
+
+def get_rdiso(azimuth, tilt):
+    """
+    rdiso_flat and rdiso of orientations, bilinearly interpolated on the
+    5 degrees grid.
+
+    azimuth -- degrees, taken modulo 360; scalar or array
+    tilt    -- degrees, clipped to [0, 90]; scalar or array
+
+    returns two arrays of the broadcast shape of azimuth and tilt
+    """
+    a = np.mod(np.asarray(azimuth, dtype=float), 360.0) / STEP
+    t = np.clip(np.asarray(tilt, dtype=float), 0.0, 90.0) / STEP
+    # the grid holds both 0 and 360, so a0 + 1 is always in it
+    a0 = np.minimum(a.astype(int), AZIMUTHS - 2)
+    t0 = np.minimum(t.astype(int), TILTS - 2)
+    wa = (a - a0)[..., None]
+    wt = (t - t0)[..., None]
+    values = ((1 - wa) * (1 - wt) * rdiso_table[a0, t0] +
+              (1 - wa) * wt * rdiso_table[a0, t0 + 1] +
+              wa * (1 - wt) * rdiso_table[a0 + 1, t0] +
+              wa * wt * rdiso_table[a0 + 1, t0 + 1])
+    return values[..., 0], values[..., 1]
@@ -6,6 +6,8 @@ PointIn = namedtuple('RichPoint', ['coords', 'inside'])
 SunPosition = namedtuple(
     'SunPosition',
     ['coords', 'azimuth', 'elevation', 'is_daylight', 't', 'sza', 'saa'])
+SunAngles = namedtuple('SunAngles',
+                       ['azimuth', 'altitude', 'sza', 'saa', 'vectors'])
 
 RdisoKey = namedtuple('RdisoKey', ['azimuth', 'tilt'])
 RdisoValue = namedtuple('RdisoValue', ['rdiso_flat', 'rdiso'])
@@ -0,0 +1,98 @@
+"""
+A node wide cache of triangulated solids in shared memory.
+
+Triangles of solids are appended to a single arena of float64 in a
+multiprocessing.shared_memory block, and an index maps gml_id to an
+(offset, count) in the arena. Workers read triangles as numpy views on
+the shared block, without copying them.
+"""
+
+import logging
+from multiprocessing import Lock, Value, shared_memory
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FLOATS_PER_TRIANGLE = 9
+ITEM_SIZE = np.dtype(np.float64).itemsize
+
+
+class SharedSolidCache:
+    def __init__(self, shm, index, lock, top):
+        self._shm = shm
+        self._index = index
+        self._lock = lock
+        self._top = top
+        self._capacity = shm.size // ITEM_SIZE
+        self._arena = np.ndarray((self._capacity, ),
+                                 dtype=np.float64,
+                                 buffer=shm.buf)
+        self._full = False
+
+    @classmethod
+    def create(cls, size, manager):
+        """
+        Create the shared block, to be called once by the parent process.
+
+        size    -- size of the arena in bytes
+        manager -- a multiprocessing.Manager holding the index
+        """
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        return cls(shm, manager.dict(), Lock(), Value('q', 0, lock=False))
+
+    def handle(self):
+        """what a worker process needs to attach to this cache"""
+        return (self._shm.name, self._index, self._lock, self._top)
+
+    @classmethod
+    def attach(cls, handle):
+        name, index, lock, top = handle
+        return cls(shared_memory.SharedMemory(name=name), index, lock, top)
+
+    def _view(self, entry):
+        offset, count = entry
+        return self._arena[offset:offset + count * FLOATS_PER_TRIANGLE]\
+            .reshape(count, 3, 3)
+
+    def get(self, id):
+        """returns a read-only (n, 3, 3) view for id, or None"""
+        entry = self._index.get(id)
+        if entry is None:
+            return None
+        view = self._view(entry)
+        view.flags.writeable = False
+        return view
+
+    def put(self, id, triangles):
+        """
+        Store triangles for id, returns the shared view, or None when
+        the arena is full.
+        """
+        if self._full:
+            return None
+        triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+        n = len(triangles) * FLOATS_PER_TRIANGLE
+        with self._lock:
+            entry = self._index.get(id)
+            if entry is None:
+                offset = self._top.value
+                if offset + n > self._capacity:
+                    self._full = True
+                    logger.warning('SharedSolidCache is full ({} bytes)'.format(
+                        self._shm.size))
+                    return None
+                self._arena[offset:offset + n] = triangles.ravel()
+                self._top.value = offset + n
+                entry = (offset, len(triangles))
+                self._index[id] = entry
+        return self.get(id)
+
+    def used(self):
+        """bytes used in the arena"""
+        return self._top.value * ITEM_SIZE
+
+    def unlink(self):
+        """release the shared block, to be called by the parent process"""
+        self._arena = None
+        self._shm.close()
+        self._shm.unlink()
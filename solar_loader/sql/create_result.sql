@@ -8,14 +8,18 @@ CREATE TABLE {results.table}(
     compute_status integer DEFAULT 0,
     compute_node character varying(32),
     compute_start timestamp with time zone,
-    compute_end timestamp with time zone
+    compute_end timestamp with time zone,
+    spatial_key character varying(12)
 );
 
 INSERT INTO
-    {results.table}(roof_id)
+    {results.table}(roof_id, spatial_key)
 SELECT
-    gml_id
+    gml_id,
+    ST_GeoHash(ST_Transform({roof.centroid}, 4326), 12)
 FROM
     {roof.table};
 
-CREATE INDEX ON {results.table} (roof_id);
\ No newline at end of file
+CREATE INDEX ON {results.table} (roof_id);
+
+CREATE INDEX ON {results.table} (spatial_key);
\ No newline at end of file
@@ -0,0 +1,19 @@
+SELECT
+  q.i,
+  s.gml_id,
+  s.geom
+FROM
+  unnest($1::bytea[], $2::bytea[]) WITH ORDINALITY AS q(volume, center, i)
+  CROSS JOIN LATERAL (
+    SELECT
+      gml_id,
+      ST_AsBinary(ST_ForceCollection({solid.geometry})) AS geom,
+      ST_3DDistance(ST_GeomFromWKB(q.center, 31370), {solid.geometry}) AS distance
+    FROM
+      {solid.table}
+    WHERE
+      ST_3DIntersects(ST_GeomFromWKB(q.volume, 31370), {solid.geometry})
+  ) AS s
+ORDER BY
+  q.i,
+  s.distance;
@@ -0,0 +1,9 @@
+SELECT
+  gml_id,
+  ST_AsBinary(ST_ForceCollection({solid.geometry}))
+FROM
+  {solid.table}
+WHERE
+  ST_3DIntersects(ST_GeomFromWKB(%s, 31370), {solid.geometry})
+ORDER BY
+  ST_3DDistance(ST_GeomFromWKB(%s, 31370), {solid.geometry});
@@ -0,0 +1,7 @@
+SELECT
+  gml_id,
+  st_astext(ST_ForceCollection({solid.geometry}), 2)
+FROM
+  {solid.table}
+WHERE
+  ST_3DDWithin(%s, {solid.geometry}, %s);
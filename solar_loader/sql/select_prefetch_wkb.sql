@@ -0,0 +1,7 @@
+SELECT
+  gml_id,
+  ST_AsBinary(ST_ForceCollection({solid.geometry}))
+FROM
+  {solid.table}
+WHERE
+  ST_3DDWithin(ST_GeomFromWKB(%s, 31370), {solid.geometry}, %s);
@@ -0,0 +1,7 @@
+SELECT
+  gml_id,
+  st_astext(ST_ForceCollection({solid.geometry}), 2)
+FROM
+  {solid.table}
+WHERE
+  {solid.geometry} && ST_MakeEnvelope(%s, %s, %s, %s, 31370);
@@ -0,0 +1,7 @@
+SELECT
+  gml_id,
+  ST_AsBinary(ST_ForceCollection({solid.geometry}))
+FROM
+  {solid.table}
+WHERE
+  {solid.geometry} && ST_MakeEnvelope(%s, %s, %s, %s, 31370);
@@ -0,0 +1,8 @@
+SELECT
+  gml_id,
+  st_astext(ST_ForceCollection({solid.geometry}), 2)
+FROM
+  {solid.table}
+WHERE
+  {solid.geometry} && %s
+  AND ST_Intersects(ST_Envelope({solid.geometry}), %s);
@@ -0,0 +1,8 @@
+SELECT
+  gml_id,
+  ST_AsBinary(ST_ForceCollection({solid.geometry}))
+FROM
+  {solid.table}
+WHERE
+  {solid.geometry} && ST_GeomFromWKB(%s, 31370)
+  AND ST_Intersects(ST_Envelope({solid.geometry}), ST_GeomFromWKB(%s, 31370));
@@ -0,0 +1,15 @@
+ALTER TABLE
+    {results.table}
+ADD
+    COLUMN IF NOT EXISTS spatial_key character varying(12);
+
+UPDATE
+    {results.table} res
+SET
+    spatial_key = ST_GeoHash(ST_Transform(ro.{roof.centroid}, 4326), 12)
+FROM
+    {roof.table} ro
+WHERE
+    res.roof_id = ro.gml_id;
+
+CREATE INDEX IF NOT EXISTS results_spatial_key_idx ON {results.table} (spatial_key);
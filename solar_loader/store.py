@@ -1,5 +1,10 @@
+import json
+import threading
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
 from time import perf_counter
+from weakref import WeakKeyDictionary
 from psycopg2.extensions import AsIs
 import numpy as np
 from munch import munchify
@@ -7,8 +12,14 @@ import logging
 from uuid import uuid4
 
 from django.db import connections
+from django.db.utils import OperationalError as DjangoOperationalError
+import psycopg2
+from psycopg2 import errors
 import random
 
+from .balancer import Balancer
+from .pool import ConnectionPool, PoolTimeout
+
 logger = logging.getLogger(__name__)
 
 
@@ -26,6 +37,114 @@ def make_queries(tables):
             )
 
 
+_registries = dict()
+
+
+def get_queries(tables):
+    """
+    Queries of the sql directory formatted for tables, as a dict by name.
+    Files are read once per process and configuration of tables.
+    """
+    key = json.dumps(tables, sort_keys=True, default=str)
+    queries = _registries.get(key)
+    if queries is None:
+        queries = dict(make_queries(tables))
+        _registries[key] = queries
+    return queries
+
+
+PREPARED_PREFIX = 'solar_'
+
+
+def prepare_query(query):
+    """
+    returns query with its %s placeholders replaced by the numbered
+    parameters of a PREPARE statement
+    """
+    parts = query.strip().rstrip(';').split('%s')
+    numbered = [parts[0]]
+    for i, part in enumerate(parts[1:]):
+        numbered.append('${}'.format(i + 1))
+        numbered.append(part)
+    return ''.join(numbered)
+
+
+# Django connection -> (psycopg2 connection, names prepared on it)
+_prepared = WeakKeyDictionary()
+
+
+def _prepared_names(conn):
+    """
+    names of statements prepared on the current session of a Django
+    connection, which is reopened with none after it has been closed
+    """
+    entry = _prepared.get(conn)
+    if entry is None or entry[0] is not conn.connection:
+        entry = (conn.connection, set())
+        _prepared[conn] = entry
+    return entry[1]
+
+
+_pools = dict()
+_pools_lock = threading.Lock()
+_pool_size = 0
+_pool_timeout = None
+
+
+def use_pools(size, timeout=None):
+    """
+    Route the connections of Data in this process through pools of at most
+    size connections per database, 0 to use Django connections.
+
+    timeout -- seconds to wait for a connection, None to wait for ever
+    """
+    global _pool_size, _pool_timeout
+    _pool_size = size
+    _pool_timeout = timeout
+
+
+def get_pool(alias):
+    """the ConnectionPool of a database alias, None without pools"""
+    if _pool_size <= 0:
+        return None
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            params = connections[alias].get_connection_params()
+            pool = ConnectionPool(alias, partial(psycopg2.connect, **params),
+                                  _pool_size, _pool_timeout)
+            _pools[alias] = pool
+    return pool
+
+
+# Django connections raise their own OperationalError around psycopg2's,
+# pooled connections raise psycopg2's
+REPLICA_FAILURES = (psycopg2.OperationalError, DjangoOperationalError,
+                    PoolTimeout)
+_balancer = Balancer(failures=REPLICA_FAILURES)
+
+
+def use_balancer(policy, eject_failures=3, eject_time=30.0):
+    """
+    Route the queries of Data in this process among the aliases of their
+    connection by policy, see balancer.Balancer
+    """
+    global _balancer
+    _balancer = Balancer(policy, eject_failures, eject_time, REPLICA_FAILURES)
+
+
+def balancer_stats():
+    """stats of replicas of this process, by database alias"""
+    return _balancer.stats()
+
+
+def pool_stats():
+    """stats of the pools of this process, by database alias"""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {alias: pool.stats() for alias, pool in pools}
+
+
 class QueryNotFound(Exception):
     def __init__(self, expression):
         self.expression = expression
@@ -55,17 +174,23 @@ def format_q(q, args):
 
 
 class Data:
-    def __init__(self, connection_name, tables, reset=False):
+    def __init__(self, connection_name, tables, reset=False, prepared=()):
+        """
+        prepared -- names of queries to run as server-side prepared
+                    statements, planned once per connection
+        """
         if isinstance(connection_name, str):
             self._cn = [connection_name]
         else:
             self._cn = connection_name
 
-        self._queries = list(make_queries(tables))
+        self._queries = get_queries(tables)
+        self._prepared = set(prepared)
         self._times = []
         self._store_id = uuid4()
 
-        if reset:
+        # pooled connections are kept across roofs
+        if reset and _pool_size <= 0:
             for cn in self._cn:
                 c = connections[cn]
                 c.close()
@@ -73,35 +198,87 @@ class Data:
     def get_connection(self):
         return connections[random.choice(self._cn)]
 
+    @contextmanager
+    def connection(self):
+        """
+        an alias chosen by the balancer and a connection to it for the
+        duration of the block, taken from the pool of the database when
+        pools are used
+        """
+        balancer = _balancer
+        alias = balancer.choose(self._cn)
+        with balancer.track(alias):
+            pool = get_pool(alias)
+            if pool is None:
+                yield alias, connections[alias]
+            else:
+                with pool.connection() as conn:
+                    yield alias, conn
+
+    def _observe(self, alias, start_time):
+        elapsed = perf_counter() - start_time
+        self._times.append(elapsed)
+        _balancer.observe(alias, elapsed)
+
     def find_query(self, query_name):
-        for name, query in self._queries:
-            if name == query_name:
-                return query
-        raise QueryNotFound(query_name)
+        try:
+            return self._queries[query_name]
+        except KeyError:
+            raise QueryNotFound(query_name)
+
+    def _execute(self, conn, cur, query_name, q, args):
+        if query_name not in self._prepared:
+            cur.execute(q, args)
+            return
+
+        name = PREPARED_PREFIX + query_name
+        names = _prepared_names(conn)
+        if name not in names:
+            cur.execute('PREPARE {} AS {}'.format(name, prepare_query(q)))
+            names.add(name)
+        if len(args) > 0:
+            statement = 'EXECUTE {}({})'.format(
+                name, ', '.join(['%s'] * len(args)))
+        else:
+            statement = 'EXECUTE {}'.format(name)
+        try:
+            cur.execute(statement, args)
+        except errors.InvalidSqlStatementName:
+            # the session lost its statements behind our back
+            names.clear()
+            raise
 
     def explain(self, query_name, args=()):
         q = self.find_query(query_name)
         return format_q(q, args)
 
     def exec(self, query_name, args=()):
-        conn = self.get_connection()
         # print('SQL({}): {}'.format(self._store_id, query_name))
-        with conn.cursor() as cur:
-            cur.execute(self.find_query(query_name), args)
+        with self.connection() as (alias, conn), conn.cursor() as cur:
+            start_time = perf_counter()
+            self._execute(conn, cur, query_name, self.find_query(query_name),
+                          args)
+            self._observe(alias, start_time)
 
-    def rows(self, query_name, safe_params={}, args=()):
+    def rows(self, query_name, safe_params={}, args=(), strict=False):
+        """
+        strict -- raise every error rather than log those of the query
+                  itself, for rows that are kept and reused
+        """
         # print('SQL({}): {}'.format(self._store_id, query_name))
-        conn = self.get_connection()
         q = self.find_query(query_name)
         try:
-            with conn.cursor() as cur:
+            with self.connection() as (alias, conn), conn.cursor() as cur:
                 start_time = perf_counter()
                 for k in safe_params:
                     q = q.replace('__{}__'.format(k), safe_params[k])
                 # print('+++++ SQL({}) ++++++++++++++++++++'.format(query_name))
                 # print(format_q(q, args))
-                cur.execute(q, args)
-                self._times.append(perf_counter() - start_time)
+                if len(safe_params) > 0:
+                    cur.execute(q, args)
+                else:
+                    self._execute(conn, cur, query_name, q, args)
+                self._observe(alias, start_time)
                 for row in cur:
                     yield row
         except Exception as ex:
@@ -112,6 +289,10 @@ Error:DB:rows({})
 {}
 ========================
 """.format(query_name, ex, format_q(q, args)))
+            # no rows is not an answer when the database could not be
+            # reached, the caller has to know the query did not run
+            if strict or isinstance(ex, REPLICA_FAILURES):
+                raise
 
     def total_exec(self):
         return len(self._times)
@@ -1,15 +1,39 @@
 import numpy as np
 from pysolar import solar
-from pyproj import Proj, transform
+from pyproj import Transformer
 from pytz import utc
 import logging
+from collections import OrderedDict
 from .records import SunPosition
-
-l72 = Proj(init='EPSG:31370')
-wgs = Proj(init='EPSG:4326')
+from .ephemeris import sun_angles
+from .geom import unit_vector
 
 logger = logging.getLogger(__name__)
 
+_l72_to_wgs = None
+
+
+def get_transformer():
+    """the Lambert72 to WGS84 transformer, built on first use"""
+    global _l72_to_wgs
+    if _l72_to_wgs is None:
+        _l72_to_wgs = Transformer.from_crs('EPSG:31370',
+                                           'EPSG:4326',
+                                           always_xy=True)
+    return _l72_to_wgs
+
+
+def l72_to_wgs(points):
+    """
+    points -- a 3d vector or a (n, 3) array in Lambert72
+
+    returns longitudes, latitudes and heights, as floats for a vector or
+    as arrays of length n
+    """
+    points = np.asarray(points, dtype=float)
+    return get_transformer().transform(points[..., 0], points[..., 1],
+                                       points[..., 2])
+
 
 def _get_coords_from_angles(ref_point, elev, azimut, dist=10000):
     """
@@ -39,8 +63,7 @@ def get_sun_position(ref_point, tim):
     returns a records.SunPosition
     """
     utc_time = tim.astimezone(utc)
-    px, py, pz = ref_point
-    lon, lat, z = transform(l72, wgs, px, py, pz)
+    lon, lat, z = l72_to_wgs(ref_point)
 
     azimut = solar.get_azimuth(lat, lon, utc_time, z)
     altitude = solar.get_altitude(lat, lon, utc_time, z)
@@ -54,3 +77,99 @@ def get_sun_position(ref_point, tim):
                                      np.deg2rad(azimut))
 
     return SunPosition(coords, azimut, altitude, True, tim, sza, saa)
+
+
+def get_sun_positions(ref_point, times):
+    """Same as get_sun_position for a sequence of times, computed at once
+    with the vectorized ephemeris
+
+    ref_point -- a 3d vector in Lambert72
+    times     -- a sequence of datetimes
+
+    returns a list of records.SunPosition
+    """
+    lon, lat, z = l72_to_wgs(ref_point)
+    angles = sun_angles(times, lat, lon, z)
+
+    positions = []
+    for tim, azimut, altitude, sza, saa in zip(times, angles.azimuth,
+                                              angles.altitude, angles.sza,
+                                              angles.saa):
+        if altitude < 1:
+            positions.append(SunPosition([0, 0, 0], 0, 0, False, tim, 0, 0))
+            continue
+        coords = _get_coords_from_angles(ref_point, np.deg2rad(altitude),
+                                         np.deg2rad(azimut))
+        positions.append(
+            SunPosition(coords, azimut, altitude, True, tim, sza, saa))
+
+    return positions
+
+
+class SunCache:
+    """
+    Sun directions keyed by a square cell of cell_size meters and a time.
+
+    Across a cell of a hundred meters the sun direction changes by about a
+    thousandth of a degree, so directions are computed once at the center
+    of the cell and shared by all the triangles and roofs in it. The cache
+    keeps the max_entries (0 for no bound) most recently used times.
+    """
+
+    def __init__(self, cell_size, max_entries, positions):
+        """
+        positions -- a function of a reference point and a sequence of
+                     times returning records.SunPosition, such as
+                     get_sun_positions
+        """
+        self._cache = OrderedDict()
+        self._positions = positions
+        self.cell_size = cell_size
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def cell(self, point):
+        return (int(point[0] // self.cell_size),
+                int(point[1] // self.cell_size))
+
+    def get(self, point, times):
+        """
+        returns a list of (is_daylight, unit vector towards the sun) for
+        times, as seen from the cell of point
+        """
+        cell = self.cell(point)
+        found = dict()
+        missing = []
+        for tim in times:
+            key = (cell, tim)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                found[tim] = self._cache[key]
+            else:
+                missing.append(tim)
+        self.hits += len(times) - len(missing)
+        self.misses += len(missing)
+
+        if len(missing) > 0:
+            center = np.array([(cell[0] + 0.5) * self.cell_size,
+                               (cell[1] + 0.5) * self.cell_size, point[2]])
+            for tim, sunpos in zip(missing,
+                                   self._positions(center, missing)):
+                found[tim] = (sunpos.is_daylight,
+                              unit_vector(sunpos.coords - center))
+                self._cache[(cell, tim)] = found[tim]
+            while (self.max_entries > 0
+                   and len(self._cache) > self.max_entries):
+                self._cache.popitem(last=False)
+
+        return [found[tim] for tim in times]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(
+            entries=len(self._cache),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups > 0 else 0.0,
+        )
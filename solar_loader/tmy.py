@@ -1,10 +1,17 @@
 import csv
+import hashlib
+import logging
+import os
 import numpy as np
-from datetime import timedelta
-from pytz import timezone
+from datetime import datetime, timedelta
+from pathlib import Path
+from pytz import timezone, utc
+
+logger = logging.getLogger(__name__)
 
 brussels_zone = timezone('Europe/Brussels')
 central_europe_zone = timezone('CET')
+HOURS_IN_LEAP_YEAR = 366 * 24
 
 
 def make_key(t):
@@ -31,43 +38,190 @@ def time_range(start, interval, n):
     return [start + (interval * i) for i in range(n)]
 
 
+def _column(values):
+    try:
+        return np.array(values, dtype=float)
+    except ValueError:
+        return np.array(values)
+
+
+def file_checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def read_csv(tmy_path):
+    """returns a structured array of the columns of a TMY file"""
+    values = dict()
+    with open(tmy_path) as f:
+        reader = csv.DictReader(f, delimiter=',')
+        logger.debug('TMY columns: {}'.format(reader.fieldnames))
+        for row in reader:
+            for name, value in row.items():
+                values.setdefault(name, []).append(value)
+    columns = [(name, _column(v)) for name, v in values.items()]
+    n = len(columns[0][1]) if len(columns) > 0 else 0
+    table = np.empty(n, dtype=[(name, c.dtype) for name, c in columns])
+    for name, column in columns:
+        table[name] = column
+    return table
+
+
 class TMY:
-    def __init__(self, tmy_path):
-        self.rows = dict()
-        self.reverse_index = dict()
-        with open(tmy_path) as f:
-            for i, row in enumerate(csv.DictReader(f, delimiter=',')):
-                if i == 0:
-                    print(row.keys())
-                # k = '{}-{}-{}'.format(row['Month'], row['Day'], row['Hour'])
-                k = '{}-{}-{}'.format(row['m'], row['dm'], row['h'])
-                self.rows[k] = row
-                self.reverse_index[k] = i
+    """
+    A typical meteorological year, kept as one array per column indexed by
+    the hour of the year (the row of the file).
+
+    The file is only read on first use. Its columns are then saved as a
+    structured array next to it (or at cache_path), with the checksum of
+    the file, and later processes memory-map this cache instead of parsing
+    the file again, as long as the checksum matches.
+
+    Averages over sample_rate days are computed once for a whole year and
+    looked up by the UTC hour of the requested time: CET and CEST being
+    whole hours away from UTC, the TMY hour of a time only depends on its
+    UTC hour.
+    """
+
+    def __init__(self, tmy_path, cache_path=None):
+        self.path = tmy_path
+        if cache_path is None:
+            cache_path = '{}.npy'.format(tmy_path)
+        self.cache_path = Path(cache_path)
+        self._columns = None
+        self._reverse_index = None
+        self._hours = dict()
+        self._averages = dict()
+
+    def _checksum_path(self):
+        return self.cache_path.with_name(self.cache_path.name + '.sha1')
+
+    def _read_cache(self, checksum):
+        try:
+            if self._checksum_path().read_text().strip() == checksum:
+                return np.load(self.cache_path.as_posix(), mmap_mode='r')
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _write_cache(self, table, checksum):
+        # a file of its own for each writer, processes starting together
+        # may all write the cache
+        tmp = self.cache_path.with_name('{}.{}.tmp.npy'.format(
+            self.cache_path.name, os.getpid()))
+        try:
+            np.save(tmp.as_posix(), table)
+            tmp.replace(self.cache_path)
+            self._checksum_path().write_text(checksum)
+        except OSError as ex:
+            if tmp.exists():
+                tmp.unlink()
+            logger.warning('Could not write TMY cache {}: {}'.format(
+                self.cache_path, ex))
+
+    def _load(self):
+        checksum = file_checksum(self.path)
+        table = self._read_cache(checksum)
+        if table is None:
+            logger.info('Reading TMY {}'.format(self.path))
+            table = read_csv(self.path)
+            self._write_cache(table, checksum)
+        self._columns = {name: table[name] for name in table.dtype.names}
+        self._reverse_index = {
+            '{}-{}-{}'.format(int(m), int(dm), int(h)): i
+            for i, (m, dm, h) in enumerate(
+                zip(table['m'].tolist(), table['dm'].tolist(),
+                    table['h'].tolist()))
+        }
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            self._load()
+        return self._columns
+
+    @property
+    def reverse_index(self):
+        if self._reverse_index is None:
+            self._load()
+        return self._reverse_index
+
+    def __len__(self):
+        return len(self.reverse_index)
 
     def row(self, t):
-        return self.rows[make_key(t)]
+        i = self.get_index(t)
+        return {name: column[i] for name, column in self.columns.items()}
 
     def get_value(self, key, t, fn=None):
-        val = self.row(t)[key]
+        val = self.columns[key][self.get_index(t)]
         if fn is not None:
             return fn(val)
         return val
 
     def get_float(self, key, t):
-        return self.get_value(key, t, lambda x: float(x))
+        return float(self.columns[key][self.get_index(t)])
 
-    def get_float_average(self, key, t, sample_rate):
+    def get_floats(self, key, indices):
+        """values of a column at an array of hours of the year"""
+        return self.columns[key][np.asarray(indices, dtype=int)]
+
+    def _hour_of_year(self, t):
+        origin = datetime(t.astimezone(utc).year, 1, 1, tzinfo=utc)
+        return origin, (t - origin) // timedelta(hours=1)
+
+    def _year_averages(self, key, sample_rate, origin):
+        """averages of key for every UTC hour of the year starting at origin"""
         sr = int(sample_rate)
-        start = t - timedelta(days=sr // 2)
-        # ref = self.get_float(key, t)
-        values = []
+        cache_key = (key, sr, origin)
+        if cache_key not in self._averages:
+            first = -24 * (sr // 2)
+            last = HOURS_IN_LEAP_YEAR + 24 * sr
+            hours_key = (origin, first, last)
+            if hours_key not in self._hours:
+                # -1 for hours missing from the TMY, such as 29 February
+                self._hours[hours_key] = np.array([
+                    self.reverse_index.get(
+                        make_key(origin + timedelta(hours=h)), -1)
+                    for h in range(first, last)
+                ])
+            index = self._hours[hours_key]
+            values = np.where(index >= 0, self.columns[key][index], np.nan)
+            hours = np.arange(HOURS_IN_LEAP_YEAR)
+            self._averages[cache_key] = np.mean(
+                [values[hours + 24 * day] for day in range(sr)], axis=0)
+        return self._averages[cache_key]
 
-        for st in time_range(start, timedelta(days=1), sr):
-            values.append(self.get_float(key, st))
+    def get_float_average(self, key, t, sample_rate):
+        """
+        average of key over sample_rate days around t, at the hour of t
+        """
+        origin, hour = self._hour_of_year(t)
+        average = self._year_averages(key, sample_rate, origin)[hour]
+        if np.isnan(average):
+            raise KeyError('No TMY data around {}'.format(t))
+        return average
 
-        avg = np.mean(values)
-        # print('{}({}) => {} {}'.format(key, sample_rate, ref, avg))
-        return avg
+    def get_float_averages(self, key, times, sample_rate):
+        """get_float_average for an array of times"""
+        seconds = np.array([t.timestamp() for t in times])
+        instants = np.floor(seconds).astype('datetime64[s]')
+        years = instants.astype('datetime64[Y]')
+        hours = (instants - years) // np.timedelta64(1, 'h')
+        averages = np.empty(len(seconds))
+        # UTC times of a local year may start in the year before
+        for year in np.unique(years):
+            rows = years == year
+            origin = datetime(int(str(year)), 1, 1, tzinfo=utc)
+            averages[rows] = self._year_averages(key, sample_rate,
+                                                 origin)[hours[rows]]
+        missing = np.flatnonzero(np.isnan(averages))
+        if len(missing) > 0:
+            raise KeyError('No TMY data around {}'.format(times[missing[0]]))
+        return averages
 
     def get_index(self, t):
         return self.reverse_index[make_key(t)]
+
+    def get_indices(self, times):
+        return np.array([self.get_index(t) for t in times], dtype=int)
@@ -0,0 +1,98 @@
+import asyncio
+import concurrent.futures
+import time
+import unittest
+from solar_loader.async_engine import AsyncQueryEngine, connect_params
+
+
+class FakeConnection:
+    def __init__(self, n, engine_stats):
+        self.n = n
+        self.closed = False
+        self.stats = engine_stats
+
+    async def fetch(self, query, *args):
+        self.stats['busy'] += 1
+        self.stats['peak'] = max(self.stats['peak'], self.stats['busy'])
+        try:
+            await asyncio.sleep(10 if query == 'slow' else 0.01)
+        finally:
+            self.stats['busy'] -= 1
+        if query == 'fail':
+            self.closed = True
+            raise ConnectionError()
+        return [(self.n, query, args)]
+
+    def is_closed(self):
+        return self.closed
+
+
+class TestAsyncEngine(unittest.TestCase):
+    def make_engine(self, size):
+        stats = dict(busy=0, peak=0, opened=0)
+
+        async def connect(n):
+            stats['opened'] += 1
+            return FakeConnection(n, stats)
+
+        return AsyncQueryEngine(connect, size), stats
+
+    def test_fetch_all(self):
+        engine, stats = self.make_engine(3)
+        results = engine.fetch_all('q', [(i, ) for i in range(20)])
+        self.assertEqual([rows[0][2] for rows in results],
+                         [(i, ) for i in range(20)])
+        self.assertEqual(stats['opened'], 3)
+        self.assertEqual(stats['peak'], 3)
+        self.assertEqual(engine.stats()['max_in_flight'], 20)
+        self.assertEqual(engine.stats()['statements'], 20)
+        # connections are kept for later calls
+        engine.fetch_all('q', [(1, )])
+        self.assertEqual(stats['opened'], 3)
+
+    def test_closed_connection(self):
+        engine, stats = self.make_engine(1)
+        with self.assertRaises(ConnectionError):
+            engine.fetch_all('fail', [()])
+        self.assertEqual(engine.stats()['connections'], 0)
+        self.assertEqual(engine.fetch_all('q', [()])[0][0][0], 1)
+
+    def test_closed_with_waiters(self):
+        engine, stats = self.make_engine(2)
+
+        async def run():
+            return await asyncio.gather(engine._fetch('fail', ()),
+                                        engine._fetch('fail', ()),
+                                        engine._fetch('q', ()),
+                                        return_exceptions=True)
+
+        # the statement waiting for a connection gets a new one when those
+        # in use close, rather than waiting for ever
+        results = asyncio.run(asyncio.wait_for(run(), 5))
+        self.assertIsInstance(results[0], ConnectionError)
+        self.assertIsInstance(results[1], ConnectionError)
+        self.assertEqual(results[2][0][0], 2)
+        self.assertEqual(engine.stats()['connections'], 1)
+
+    def test_timeout(self):
+        engine, stats = self.make_engine(2)
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            engine.fetch_all('slow', [(i, ) for i in range(4)], timeout=0.05)
+        # the statements are cancelled, not left running
+        for _ in range(100):
+            if stats['busy'] == 0 and engine.in_flight == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(stats['busy'], 0)
+        self.assertEqual(engine.in_flight, 0)
+        self.assertEqual(len(engine.fetch_all('q', [(1, ), (2, )])), 2)
+
+    def test_connect_params(self):
+        self.assertEqual(
+            connect_params(dict(NAME='solar', USER='u', PASSWORD='',
+                                HOST='db', PORT='5432')),
+            dict(database='solar', user='u', host='db', port='5432'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from solar_loader.balancer import Balancer
+
+
+class Timeout(Exception):
+    pass
+
+
+class TestBalancer(unittest.TestCase):
+    def test_least(self):
+        balancer = Balancer('least')
+        with balancer.track('a'):
+            with balancer.track('a'):
+                with balancer.track('b'):
+                    self.assertEqual(balancer.choose(['a', 'b', 'c']), 'c')
+                    with balancer.track('c'), balancer.track('c'):
+                        self.assertEqual(balancer.choose(['a', 'b', 'c']),
+                                         'b')
+        self.assertEqual(balancer.stats()['a']['in_flight'], 0)
+        self.assertEqual(balancer.stats()['a']['queries'], 2)
+
+    def test_ewma(self):
+        balancer = Balancer('ewma')
+        # unmeasured replicas are tried first
+        balancer.observe('a', 0.1)
+        self.assertEqual(balancer.choose(['a', 'b']), 'b')
+        balancer.observe('b', 0.5)
+        self.assertEqual(balancer.choose(['a', 'b']), 'a')
+        # a busy fast replica ends up costing more than an idle slow one
+        with balancer.track('a'), balancer.track('a'), \
+                balancer.track('a'), balancer.track('a'), \
+                balancer.track('a'):
+            self.assertEqual(balancer.choose(['a', 'b']), 'b')
+        for _ in range(20):
+            balancer.observe('b', 0.01)
+        self.assertLess(balancer.stats()['b']['latency'], 0.1)
+        self.assertEqual(balancer.choose(['a', 'b']), 'b')
+
+    def test_ejection(self):
+        balancer = Balancer('least', eject_failures=2, eject_time=60,
+                            failures=(Timeout, ))
+        for _ in range(2):
+            with self.assertRaises(Timeout):
+                with balancer.track('a'):
+                    raise Timeout()
+        stats = balancer.stats()['a']
+        self.assertTrue(stats['ejected'])
+        self.assertEqual(stats['failures'], 2)
+        for _ in range(5):
+            self.assertEqual(balancer.choose(['a', 'b']), 'b')
+        # other errors do not count against a replica
+        with self.assertRaises(ValueError):
+            with balancer.track('b'):
+                raise ValueError()
+        self.assertFalse(balancer.stats()['b']['ejected'])
+        # with every replica ejected, all are used again
+        for _ in range(2):
+            with self.assertRaises(Timeout):
+                with balancer.track('b'):
+                    raise Timeout()
+        self.assertTrue(balancer.stats()['b']['ejected'])
+        self.assertIn(balancer.choose(['a', 'b']), ['a', 'b'])
+
+    def test_policy(self):
+        with self.assertRaises(ValueError):
+            Balancer('fastest')
+
+
+if __name__ == '__main__':
+    unittest.main()
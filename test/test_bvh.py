@@ -0,0 +1,151 @@
+import unittest
+import numpy as np
+from solar_loader import bvh
+from solar_loader.records import Triangle
+
+
+def make_box(x, y, z, size):
+    """triangles of the top and bottom faces of a cube"""
+    lo = np.array([x, y, z], dtype=float)
+    s = size
+    quads = [
+        [(0, 0, 0), (s, 0, 0), (s, s, 0), (0, s, 0)],
+        [(0, 0, s), (s, 0, s), (s, s, s), (0, s, s)],
+    ]
+    tris = []
+    for q in quads:
+        q = [lo + np.array(p) for p in q]
+        tris.append([q[0], q[1], q[2]])
+        tris.append([q[0], q[2], q[3]])
+    return np.array(tris)
+
+
+GROUND = Triangle(
+    np.array([0.0, 0.0, 0.0]),
+    np.array([4.0, 0.0, 0.0]),
+    np.array([0.0, 4.0, 0.0]),
+)
+
+
+class TestBVH(unittest.TestCase):
+    def test_prism_hits(self):
+        up = np.array([0.0, 0.0, 1.0])
+        above = make_box(0, 0, 10, 2)
+        aside = make_box(50, 50, 10, 2)
+        hits = bvh.prism_hits(np.concatenate([above, aside]), GROUND, up,
+                              1.0, 200.0)
+        self.assertTrue(np.all(hits[:len(above)]))
+        self.assertFalse(np.any(hits[len(above):]))
+
+    def test_prism_hits_depth(self):
+        up = np.array([0.0, 0.0, 1.0])
+        below = make_box(0, 0, -20, 2)
+        beyond = make_box(0, 0, 300, 2)
+        hits = bvh.prism_hits(np.concatenate([below, beyond]), GROUND, up,
+                              1.0, 200.0)
+        self.assertFalse(np.any(hits))
+
+    def test_prism_hits_behind(self):
+        sunvec = np.array([1.0, 0.0, 1.0]) / np.sqrt(2)
+        # under the ground, along the sun line of a point of the triangle
+        # but behind it, though within the depth range of the prism
+        p = np.array([2.0, 1.0, -0.5])
+        behind = np.array([[p, p + [0.1, 0, 0], p + [0, 0.1, 0]]])
+        self.assertFalse(np.any(bvh.prism_hits(behind, GROUND, sunvec,
+                                               1.0, 200.0)))
+        inside = behind + sunvec * 10
+        self.assertTrue(np.all(bvh.prism_hits(inside, GROUND, sunvec,
+                                              1.0, 200.0)))
+
+    def test_prism_hits_exact(self):
+        rng = np.random.default_rng(3)
+        a, b, c = GROUND
+        found = 0
+        for _ in range(50):
+            sunvec = rng.normal(size=3)
+            sunvec[2] = abs(sunvec[2]) + 0.1
+            sunvec /= np.linalg.norm(sunvec)
+            tris = rng.uniform(-10, 20, size=(40, 3, 3))
+            tris = tris[:, :1] + (tris - tris[:, :1]) * 0.3
+            hits = bvh.prism_hits(tris, GROUND, sunvec, 1.0, 20.0)
+            # points of the faces found in the prism
+            w = rng.dirichlet([1, 1, 1], size=200)
+            points = np.einsum('sv,mvd->msd', w, tris)
+            frame = np.stack([b - a, c - a, sunvec], axis=1)
+            coords = np.linalg.solve(frame, (points - a)[..., None])[..., 0]
+            inside = np.any((coords[..., 0] >= 0) & (coords[..., 1] >= 0)
+                            & (coords[..., 0] + coords[..., 1] <= 1)
+                            & (coords[..., 2] >= 1.0)
+                            & (coords[..., 2] <= 20.0), axis=1)
+            self.assertTrue(np.all(hits[inside]))
+            found += np.count_nonzero(inside)
+            # nor faces entirely behind the near end or beyond the far end
+            normal = np.cross(b - a, c - a)
+            behind = np.all((tris - (a + sunvec)) @ normal < -1e-3, axis=1)
+            beyond = np.all((tris - (a + sunvec * 20)) @ normal > 1e-3, axis=1)
+            self.assertFalse(np.any(hits[behind | beyond]))
+        self.assertGreater(found, 0)
+
+    def test_query_prism_order(self):
+        up = np.array([0.0, 0.0, 1.0])
+        index = bvh.SolidBVH([
+            ('far', make_box(0, 0, 100, 2)),
+            ('aside', make_box(50, 50, 10, 2)),
+            ('near', make_box(1, 1, 10, 2)),
+        ], leaf_size=2)
+        ids = [index.ids[o] for o, _ in index.query_prism(GROUND, up, 1.0, 200.0)]
+        self.assertEqual(ids, ['near', 'far'])
+
+    def test_query_prism_matches_brute_force(self):
+        rng = np.random.default_rng(42)
+        solids = [(i, make_box(*rng.uniform(-100, 100, 2),
+                               rng.uniform(0, 30), rng.uniform(1, 10)))
+                  for i in range(200)]
+        index = bvh.SolidBVH(solids, leaf_size=4)
+        for _ in range(20):
+            sunvec = rng.normal(size=3)
+            sunvec[2] = abs(sunvec[2])
+            sunvec /= np.linalg.norm(sunvec)
+            expected = set(
+                id for id, tris in solids
+                if np.any(bvh.prism_hits(tris, GROUND, sunvec, 1.0, 200.0)))
+            found = set(
+                index.ids[o]
+                for o, _ in index.query_prism(GROUND, sunvec, 1.0, 200.0))
+            self.assertEqual(found, expected)
+
+    def test_tile_index(self):
+        up = np.array([0.0, 0.0, 1.0])
+        loaded = []
+
+        def fetch(xmin, ymin, xmax, ymax):
+            loaded.append((xmin, ymin))
+            if xmin <= 1 < xmax and ymin <= 1 < ymax:
+                yield 'near', make_box(1, 1, 10, 2)
+
+        index = bvh.TileIndex(fetch, 100, 4)
+        found = index.query_prism(GROUND, up, 1.0, 200.0)
+        self.assertEqual([id for id, _ in found], ['near'])
+        self.assertEqual(found[0][1].shape, (4, 3, 3))
+        n = len(loaded)
+        index.query_prism(GROUND, up, 1.0, 200.0)
+        self.assertEqual(len(loaded), n)
+
+    def test_tile_index_failure(self):
+        up = np.array([0.0, 0.0, 1.0])
+        failures = [RuntimeError('connection lost')]
+
+        def fetch(xmin, ymin, xmax, ymax):
+            yield 'near', make_box(1, 1, 10, 2)
+            if len(failures) > 0:
+                raise failures.pop()
+
+        index = bvh.TileIndex(fetch, 100, 4)
+        with self.assertRaises(RuntimeError):
+            index.query_prism(GROUND, up, 1.0, 200.0)
+        found = index.query_prism(GROUND, up, 1.0, 200.0)
+        self.assertEqual([id for id, _ in found], ['near'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import numpy as np
+from solar_loader import geom
+from solar_loader.compute import (
+    get_exposed_area,
+    get_exposed_area_vectorized,
+)
+from solar_loader.records import GisTriangle, Triangle
+
+
+def make_gis_triangle(a, b, c):
+    t = Triangle(np.array(a, dtype=float), np.array(b, dtype=float),
+                 np.array(c, dtype=float))
+    return GisTriangle(t, geom.get_triangle_azimut(t),
+                       geom.get_triangle_inclination(t),
+                       geom.get_triangle_center(t), geom.get_triangle_area(t))
+
+
+def make_slab(x0, y0, x1, y1, z):
+    """an horizontal square, as two triangles"""
+    return np.array([
+        [[x0, y0, z], [x1, y0, z], [x1, y1, z]],
+        [[x0, y0, z], [x1, y1, z], [x0, y1, z]],
+    ], dtype=float)
+
+
+class TestCompute(unittest.TestCase):
+    def test_get_exposed_area_vectorized(self):
+        """Test compute.get_exposed_area_vectorized against get_exposed_area"""
+        tr = make_gis_triangle([0, 0, 0], [10, 0, 0], [0, 10, 0])
+        sunvec = geom.unit_vector(np.array([0.1, 0.2, 1.0]))
+        cases = [
+            [],
+            [make_slab(20, 20, 30, 30, 10)],
+            [make_slab(-5, -5, 4, 4, 10)],
+            [make_slab(-5, -5, 4, 4, 10), make_slab(2, -5, 6, 3, 12)],
+            [make_slab(-20, -20, 20, 20, 10)],
+        ]
+        for solids in cases:
+            self.assertAlmostEqual(
+                get_exposed_area(tr, sunvec, solids),
+                get_exposed_area_vectorized(tr, sunvec, solids, chunk=1),
+            )
+        self.assertEqual(
+            get_exposed_area_vectorized(tr, sunvec, cases[-1]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+from solar_loader import cube
+from solar_loader.radiation import compute_gk
+from solar_loader.rdiso import get_rdiso5
+from solar_loader.time import hours_for_year
+from solar_loader.tmy import TMY
+
+DAYS_IN_MONTHS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+
+def write_tmy(path):
+    """a TMY with a sun going up and down every day"""
+    rng = np.random.default_rng(7)
+    with open(path, 'w') as f:
+        f.write('m,dm,h,G_Gh,G_Dh,hs,Az,Ta\n')
+        for m, days in enumerate(DAYS_IN_MONTHS, 1):
+            for d in range(1, days + 1):
+                for h in range(1, 25):
+                    hs = 40 * np.sin(np.pi * (h - 6) / 12)
+                    gh = max(0, 8 * hs + rng.uniform(0, 100))
+                    f.write('{},{},{},{:.1f},{:.1f},{:.2f},{:.1f},10\n'.format(
+                        m, d, h, gh, gh * rng.uniform(0.2, 0.8), hs,
+                        (h - 12) * 15))
+
+
+class TestCube(unittest.TestCase):
+    def test_rolling_mean(self):
+        values = np.arange(cube.HOURS, dtype=float)
+        means = cube.rolling_mean(values, 3)
+        self.assertEqual(means[100], values[100])
+        self.assertEqual(means[10], (values[10 - 24 + cube.HOURS] +
+                                     values[10] + values[34]) / 3)
+
+    def test_build_cube(self):
+        sample_rate = 5
+        with tempfile.TemporaryDirectory() as tmp:
+            tmy_path = Path(tmp).joinpath('tmy.csv').as_posix()
+            path = Path(tmp).joinpath('cube.npy').as_posix()
+            write_tmy(tmy_path)
+            tmy = TMY(tmy_path)
+            cube.build_cube(tmy, sample_rate, path, 2018)
+
+            self.assertIsNone(cube.load_cube(path, tmy_path, 14, 2018))
+            self.assertIsNone(cube.load_cube(path, tmy_path, sample_rate,
+                                             2019))
+            values = cube.load_cube(path, tmy_path, sample_rate, 2018)
+            self.assertEqual(values.shape, (73, 19, cube.HOURS, 2))
+
+            rdiso_flat, rdiso = get_rdiso5(135, 30)
+            times = list(hours_for_year(2018))[2000:2024]
+            hours = [tmy.get_index(tim) for tim in times]
+            cube_gk, cube_bk = cube.cube_radiations(values, 135, 30, hours)
+            for tim, i, gk_i, bk_i in zip(times, hours, cube_gk, cube_bk):
+                gk, bk = compute_gk(
+                    tmy.get_float_average('G_Gh', tim, sample_rate),
+                    tmy.get_float_average('G_Dh', tim, sample_rate),
+                    90.0 - tmy.get_float('hs', tim), tmy.get_float('Az', tim),
+                    0.2, 135, 30, 28, 1, tim.month, i, rdiso_flat, rdiso)
+                self.assertAlmostEqual(gk, gk_i, places=3)
+                self.assertAlmostEqual(bk, bk_i, places=3)
+
+            # between orientations of the grid
+            gk, bk = cube.cube_radiations(values, 137.5, 30, hours)
+            expected = (values[27, 6, hours] + values[28, 6, hours]) / 2
+            np.testing.assert_allclose(gk, expected[:, cube.GK], rtol=1e-6)
+            np.testing.assert_allclose(bk, expected[:, cube.BK], rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
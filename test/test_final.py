@@ -0,0 +1,132 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import numpy as np
+from django.conf import settings
+from shapely import geometry
+
+# final reads its settings on import, the TMY file only on first use
+if not settings.configured:
+    settings.configure()
+if not hasattr(settings, 'SOLAR_TMY'):
+    settings.SOLAR_TMY = 'tmy.csv'
+
+from solar_loader import bvh, final  # noqa: E402
+from solar_loader.final import IntersectCache, SweepCandidates  # noqa: E402
+from solar_loader.records import Triangle  # noqa: E402
+
+
+def make_row(id, size=1.0):
+    """a row of a solid made of a square, triangulated in 2 faces"""
+    square = geometry.Polygon([(0, 0, 0), (size, 0, 0), (size, size, 0),
+                               (0, size, 0)])
+    return [id, geometry.MultiPolygon([square])]
+
+
+# 2 triangles of 9 floats
+SOLID_BYTES = 2 * 9 * 8
+
+
+class TestIntersectCache(unittest.TestCase):
+    def test_eviction_order(self):
+        cache = IntersectCache(max_entries=2)
+        a = cache.get_solid(make_row('a'))
+        self.assertEqual(a.shape, (2, 3, 3))
+        cache.get_solid(make_row('b'))
+        # a is used again, so b is the least recently used
+        self.assertIs(cache.get_solid(make_row('a')), a)
+        cache.get_solid(make_row('c'))
+        self.assertIs(cache.get_solid(make_row('a')), a)
+        cache.get_solid(make_row('b'))
+
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 4)
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['bytes'], 2 * SOLID_BYTES)
+
+    def test_byte_bound(self):
+        cache = IntersectCache(max_bytes=3 * SOLID_BYTES)
+        for id in range(10):
+            cache.get_solid(make_row(id))
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 3)
+        self.assertEqual(stats['bytes'], 3 * SOLID_BYTES)
+        self.assertEqual(stats['evictions'], 7)
+
+    def test_threads(self):
+        cache = IntersectCache(max_entries=3)
+        rows = [make_row('s{}'.format(i % 8)) for i in range(4000)]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            solids = list(executor.map(cache.get_solid, rows))
+        self.assertTrue(all(s.shape == (2, 3, 3) for s in solids))
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], len(rows))
+        self.assertEqual(stats['entries'], 3)
+        self.assertEqual(stats['bytes'], 3 * SOLID_BYTES)
+        # a miss inserts the solid, unless another thread just did
+        self.assertLessEqual(stats['evictions'] + stats['entries'],
+                             stats['misses'])
+
+
+def make_block(x, y, height, size):
+    """a row of a solid made of the faces of a block"""
+    x1, y1 = x + size, y + size
+    corners = [(x, y), (x1, y), (x1, y1), (x, y1)]
+    faces = [
+        [(cx, cy, 0) for cx, cy in corners],
+        [(cx, cy, height) for cx, cy in corners],
+    ]
+    for (ax, ay), (bx, by) in zip(corners, corners[1:] + corners[:1]):
+        faces.append([(ax, ay, 0), (bx, by, 0), (bx, by, height),
+                      (ax, ay, height)])
+    return geometry.MultiPolygon([geometry.Polygon(f) for f in faces])
+
+
+class TestSweepCandidates(unittest.TestCase):
+    def test_query(self):
+        rng = np.random.default_rng(5)
+        rows = [['b{}'.format(i),
+                 make_block(*rng.uniform(-60, 60, 2), rng.uniform(2, 30),
+                            rng.uniform(1, 8))]
+                for i in range(150)]
+        triangle = Triangle(np.array([0.0, 0.0, 8.0]),
+                            np.array([6.0, 0.0, 10.0]),
+                            np.array([0.0, 6.0, 9.0]))
+        sunvecs = []
+        for azimuth in np.linspace(0, 2 * np.pi, 12, endpoint=False):
+            for altitude in (0.1, 0.4, 0.9):
+                sunvecs.append(np.array([
+                    np.cos(altitude) * np.sin(azimuth),
+                    np.cos(altitude) * np.cos(azimuth),
+                    np.sin(altitude)
+                ]))
+
+        sweep = SweepCandidates(triangle)
+        for sunvec in sunvecs:
+            sweep.add(sunvec)
+        with mock.patch.object(final, 'rows_with_geom',
+                               return_value=iter(rows)):
+            found = [sweep.query(None, sunvec) for sunvec in sunvecs]
+
+        # what select_intersect finds for each hour
+        solids = [final.intersect_cache.get_solid(row) for row in rows]
+        hits = 0
+        for sunvec, candidates in zip(sunvecs, found):
+            expected = [
+                id for (id, _), tris in zip(rows, solids)
+                if np.any(bvh.prism_hits(tris, triangle, sunvec,
+                                         final.SHADOW_NEAR, final.SHADOW_FAR))
+            ]
+            self.assertEqual(
+                sorted(id for (id, _), tris in zip(rows, solids)
+                       if any(tris is c for c in candidates)),
+                sorted(expected))
+            hits += len(expected)
+        self.assertGreater(hits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -176,6 +176,37 @@ class TestGeom(unittest.TestCase):
         self.assertAlmostEqual(
             np.rad2deg(geom.angle_between([0, -1, 0], [0, 0, 1])), 90)
 
+    def test_sample_triangle(self):
+        """Test for the function geom.sample_triangle"""
+        t = Triangle(
+            np.array([0.0, 0.0, 1.0]),
+            np.array([3.0, 0.0, 1.0]),
+            np.array([0.0, 3.0, 1.0]),
+        )
+        for k in [1, 2, 5]:
+            pts = geom.sample_triangle(t, k)
+            self.assertEqual(len(pts), k * k)
+            self.assertTrue(np.all(pts[:, 0] > 0))
+            self.assertTrue(np.all(pts[:, 1] > 0))
+            self.assertTrue(np.all(pts[:, 0] + pts[:, 1] < 3))
+            np.testing.assert_array_almost_equal(pts[:, 2], 1.0)
+            np.testing.assert_array_almost_equal(
+                pts.mean(axis=0), [1.0, 1.0, 1.0])
+
+    def test_intersect_rays_triangles(self):
+        """Test for the function geom.intersect_rays_triangles"""
+        roof = np.array([[[0, 0, 10], [10, 0, 10], [0, 10, 10]]], dtype=float)
+        origins = np.array([
+            [1.0, 1.0, 0.0],
+            [9.0, 9.0, 0.0],
+            [1.0, 1.0, 20.0],
+        ])
+        up = np.array([0.0, 0.0, 1.0])
+        hits = geom.intersect_rays_triangles(origins, up, roof)
+        self.assertEqual(hits.tolist(), [True, False, False])
+        hits = geom.intersect_rays_triangles(origins, up, roof, t_min=15)
+        self.assertEqual(hits.tolist(), [False, False, False])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+from solar_loader import horizon
+from solar_loader.records import Triangle
+
+
+def make_wall(x0, x1, y, height):
+    """a vertical wall along x, at y, from the ground"""
+    a = [x0, y, 0]
+    b = [x1, y, 0]
+    c = [x1, y, height]
+    d = [x0, y, height]
+    return np.array([[a, b, c], [a, c, d]], dtype=float)
+
+
+def sun_from(azimuth, elevation):
+    az = np.deg2rad(azimuth)
+    el = np.deg2rad(elevation)
+    return np.array([
+        np.sin(az) * np.cos(el),
+        np.cos(az) * np.cos(el),
+        np.sin(el),
+    ])
+
+
+class TestHorizon(unittest.TestCase):
+    def test_azimuth_elevation(self):
+        az, el = horizon.azimuth_elevation(sun_from(135, 30))
+        self.assertAlmostEqual(float(az), 135)
+        self.assertAlmostEqual(float(el), 30)
+
+    def test_compute_horizon(self):
+        # a 10m high wall, 10m south of the origin
+        wall = make_wall(-50, 50, -10, 10)
+        h = horizon.compute_horizon([[0, 0, 0]], wall)
+        self.assertAlmostEqual(h[0, 180], 45, delta=1)
+        self.assertEqual(h[0, 0], -90)
+        self.assertTrue(np.all(h[0, 105:255] > 0))
+
+    def test_sun_visibility(self):
+        t = Triangle(
+            np.array([0.0, 0.0, 0.0]),
+            np.array([2.0, 0.0, 0.0]),
+            np.array([0.0, 2.0, 0.0]),
+        )
+        wall = make_wall(-50, 50, -10, 10)
+        h = horizon.compute_horizon(horizon.triangle_points(t), wall)
+        self.assertEqual(horizon.sun_visibility(h, sun_from(180, 30)), 0)
+        self.assertEqual(horizon.sun_visibility(h, sun_from(180, 60)), 1)
+        self.assertEqual(horizon.sun_visibility(h, sun_from(0, 10)), 1)
+
+    def test_sky_visibility(self):
+        wall = make_wall(-50, 50, -10, 10)
+        h = horizon.compute_horizon([[0, 0, 0]], wall)
+        sky = horizon.sky_visibility(h)
+        self.assertEqual(sky.shape, (360, 90))
+        # zenith angles of 60 and 30 degrees, to the south and the north
+        self.assertEqual(sky[180, 60], 0)
+        self.assertEqual(sky[180, 30], 1)
+        self.assertEqual(sky[0, 60], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
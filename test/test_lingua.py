@@ -0,0 +1,51 @@
+import struct
+import unittest
+import numpy as np
+from shapely import wkb, wkt
+from solar_loader import lingua
+from solar_loader.records import Triangle
+
+
+class FakeData:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def rows(self, select, safe_params, params, strict=False):
+        return iter(self._rows)
+
+
+class TestLingua(unittest.TestCase):
+    def test_polyhedral_wkb(self):
+        t0 = Triangle(np.array([0.0, 0.0, 1.0]), np.array([4.0, 0.0, 1.0]),
+                      np.array([0.0, 3.0, 1.0]))
+        t1 = Triangle(*[p + [1.234, 2.5, 10.0] for p in t0])
+        data = lingua.make_polyhedral_wkb(t0, t1)
+
+        self.assertEqual(struct.unpack('<BII', data[:9]),
+                         (1, lingua.WKB_POLYHEDRALSURFACE_Z, 5))
+        # same faces as the text surface, read back as a multipolygon
+        multi = wkb.loads(data[:1] + struct.pack('<I', 1006) + data[5:])
+        text = lingua.make_polygon(t0, t1)
+        expected = wkt.loads(text[text.index("'") + 1:text.rindex("'")])
+        self.assertEqual(len(multi.geoms), len(expected.geoms))
+        for face, expected_face in zip(multi.geoms, expected.geoms):
+            np.testing.assert_allclose(face.exterior.coords,
+                                       expected_face.exterior.coords,
+                                       atol=0.005)
+
+    def test_rows_with_geom(self):
+        point = wkt.loads('POINT Z (1 2 3)')
+        db = FakeData([
+            ('a', 'POINT Z (1 2 3)'),
+            ('b', memoryview(lingua.make_point_wkb((1, 2, 3)))),
+            ('c', b'garbage'),
+        ])
+        rows = list(lingua.rows_with_geom(db, 'select', (), 1))
+        self.assertEqual([row[0] for row in rows], ['a', 'b'])
+        for row in rows:
+            self.assertTrue(row[1].equals(point))
+            self.assertEqual(row[1].z, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
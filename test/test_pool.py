@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+import psycopg2
+from solar_loader.pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, q, args=None):
+        if self.conn.dead:
+            self.conn.closed = 2
+            raise psycopg2.OperationalError('server closed the connection')
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class TestPool(unittest.TestCase):
+    def test_reuse(self):
+        pool = ConnectionPool('test', FakeConnection, 2)
+        with pool.connection() as a:
+            pass
+        with pool.connection() as b:
+            self.assertIs(b, a)
+            self.assertTrue(b.connection.autocommit)
+        stats = pool.stats()
+        self.assertEqual(stats['open'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['waits'], 0)
+
+    def test_bounded(self):
+        pool = ConnectionPool('test', FakeConnection, 2)
+        in_use = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with pool.connection() as conn:
+                with lock:
+                    in_use.append(conn)
+                    peak.append(len(in_use))
+                time.sleep(0.02)
+                with lock:
+                    in_use.remove(conn)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        stats = pool.stats()
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(stats['open'], 2)
+        self.assertEqual(stats['checkouts'], 8)
+        self.assertGreater(stats['waits'], 0)
+        self.assertGreater(stats['max_wait'], 0)
+
+    def test_timeout(self):
+        pool = ConnectionPool('test', FakeConnection, 1, timeout=0.01)
+        with pool.connection():
+            with self.assertRaises(PoolTimeout):
+                with pool.connection():
+                    pass
+
+    def test_liveness(self):
+        pool = ConnectionPool('test', FakeConnection, 1, check_interval=0)
+        with pool.connection() as a:
+            a.connection.dead = True
+        with pool.connection() as b:
+            self.assertIsNot(b, a)
+        with pool.connection() as c:
+            c.connection.closed = 2
+        with pool.connection() as d:
+            self.assertIsNot(d, c)
+        stats = pool.stats()
+        self.assertEqual(stats['open'], 1)
+        self.assertEqual(pool.closed, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
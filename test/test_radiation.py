@@ -1,5 +1,11 @@
 import unittest
-from solar_loader.radiation import compute_gk  # not tested: roof_rdiso airmass
+import numpy as np
+from solar_loader.radiation import (  # not tested: airmass
+    compute_gk,
+    compute_gk_array,
+    roof_rdiso,
+    roof_rdiso_array,
+)
 from data_test_radiation import res_to_check
 
 
@@ -8,6 +14,22 @@ class TestRadiation(unittest.TestCase):
     def test_roof_rdiso(self):
         pass
 
+    def test_roof_rdiso_array(self):
+        for azimuth, inclination, visibility in [(0, 0, 1), (37, 25, 1),
+                                                 (190, 90, 0.7)]:
+            expected = roof_rdiso(azimuth, inclination, visibility)
+            result = roof_rdiso_array(azimuth, inclination, visibility)
+            self.assertAlmostEqual(expected[0], float(result[0]))
+            self.assertAlmostEqual(expected[1], float(result[1]))
+
+        # the southern half of the sky hidden
+        sky = np.ones((360, 90))
+        sky[90:270] = 0
+        south = roof_rdiso_array(180, 45, sky)
+        north = roof_rdiso_array(0, 45, sky)
+        self.assertAlmostEqual(float(south[0]), 0.5, places=4)
+        self.assertLess(float(south[1]), float(north[1]))
+
     def test_airmass(self):
         pass
 
@@ -46,6 +68,32 @@ class TestRadiation(unittest.TestCase):
     def test_compute_gk(self):
         self._test_compute_gk(1, 90, 5)
 
+    def test_compute_gk_array(self):
+        rng = np.random.default_rng(42)
+        n = 500
+        gh = rng.uniform(0, 900, n)
+        gh[:20] = 0
+        dh = gh * rng.uniform(0.05, 1.0, n) + 1
+        sza = rng.uniform(0, 95, n)
+        saa = rng.uniform(-180, 180, n)
+        azimuth = rng.uniform(0, 360, n)
+        inclination = rng.uniform(0, 90, n)
+        visibility = rng.uniform(0, 1, n)
+        month = rng.integers(1, 13, n)
+        i = rng.integers(0, 8760, n)
+        rdiso_flat = rng.uniform(0.5, 1, n)
+        rdiso = rng.uniform(0.5, 1, n)
+
+        gk, bk = compute_gk_array(gh, dh, sza, saa, 0.2, azimuth, inclination,
+                                  28, visibility, month, i, rdiso_flat, rdiso)
+        for k in range(n):
+            expected = compute_gk(gh[k], dh[k], sza[k], saa[k], 0.2,
+                                  azimuth[k], inclination[k], 28,
+                                  visibility[k], month[k], i[k],
+                                  rdiso_flat[k], rdiso[k])
+            self.assertAlmostEqual(expected[0], gk[k])
+            self.assertAlmostEqual(expected[1], bk[k])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+import numpy as np
+from solar_loader.rdiso import RDIsoError, get_rdiso, get_rdiso5
+
+
+class TestRdiso(unittest.TestCase):
+    def test_get_rdiso5(self):
+        self.assertEqual(tuple(get_rdiso5(0, 5)), (1.0, 0.9981366252456282))
+        self.assertEqual(tuple(get_rdiso5(360, 90)), tuple(get_rdiso5(0, 90)))
+        with self.assertRaises(RDIsoError):
+            get_rdiso5(182, 30)
+        with self.assertRaises(RDIsoError):
+            get_rdiso5(365, 30)
+
+    def test_get_rdiso(self):
+        azimuths = np.array([0, 90, 185, 270, 355])
+        tilts = np.array([0, 15, 30, 60, 90])
+        rdiso_flat, rdiso = get_rdiso(azimuths, tilts)
+        for i, (a, t) in enumerate(zip(azimuths, tilts)):
+            self.assertEqual(rdiso_flat[i], get_rdiso5(a, t).rdiso_flat)
+            self.assertAlmostEqual(rdiso[i], get_rdiso5(a, t).rdiso)
+
+        # interpolation and wrap-around at 0/360
+        _, mid = get_rdiso(182.5, 32.5)
+        corners = [get_rdiso5(a, t).rdiso for a in (180, 185)
+                   for t in (30, 35)]
+        self.assertAlmostEqual(float(mid), np.mean(corners))
+        np.testing.assert_allclose(get_rdiso(-2.5, 40), get_rdiso(357.5, 40))
+        np.testing.assert_allclose(get_rdiso(720, 40), get_rdiso(0, 40))
+
+
+if __name__ == '__main__':
+    unittest.main()
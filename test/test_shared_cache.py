@@ -0,0 +1,53 @@
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+import numpy as np
+from solar_loader.shared_cache import SharedSolidCache
+
+worker_cache = None
+
+
+def attach(handle):
+    global worker_cache
+    worker_cache = SharedSolidCache.attach(handle)
+
+
+def put_and_sum(id):
+    tris = np.full((id + 1, 3, 3), float(id))
+    worker_cache.put(id, tris)
+    return float(worker_cache.get(id).sum())
+
+
+class TestSharedSolidCache(unittest.TestCase):
+    def test_put_get(self):
+        with Manager() as manager:
+            cache = SharedSolidCache.create(1024, manager)
+            try:
+                tris = np.arange(18, dtype=float).reshape(2, 3, 3)
+                view = cache.put('a', tris)
+                np.testing.assert_array_equal(view, tris)
+                np.testing.assert_array_equal(cache.get('a'), tris)
+                self.assertIsNone(cache.get('b'))
+                self.assertEqual(cache.used(), tris.nbytes)
+                # 1024 bytes hold 14 triangles
+                self.assertIsNone(cache.put('c', np.zeros((13, 3, 3))))
+            finally:
+                cache.unlink()
+
+    def test_workers(self):
+        with Manager() as manager:
+            cache = SharedSolidCache.create(1 << 16, manager)
+            try:
+                with ProcessPoolExecutor(
+                        2, initializer=attach,
+                        initargs=(cache.handle(), )) as executor:
+                    sums = list(executor.map(put_and_sum, range(8)))
+                for id, total in enumerate(sums):
+                    self.assertEqual(total, id * (id + 1) * 9)
+                    self.assertEqual(cache.get(id).shape, (id + 1, 3, 3))
+            finally:
+                cache.unlink()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+from unittest import mock
+from django.conf import settings
+from django.db.utils import ConnectionHandler, OperationalError
+from solar_loader import store
+from solar_loader.pool import ConnectionPool, PoolTimeout
+from solar_loader.store import Data, QueryNotFound, get_queries, prepare_query
+
+TABLES = {
+    "ground": {"table": "g", "geometry": "geom", "capakey": "capakey"},
+    "roof": {"table": "r", "geometry": "geom", "centroid": "centroid"},
+    "solid": {"table": "s", "geometry": "geom"},
+    "results": {"table": "res", "roof_id": "roof_id",
+                "irradiance": "irradiance"},
+}
+
+
+class TestStore(unittest.TestCase):
+    def test_get_queries(self):
+        queries = get_queries(TABLES)
+        self.assertIs(get_queries(dict(TABLES)), queries)
+        self.assertIn('FROM\n  s\n', queries['select_intersect'])
+
+        db = Data('default', TABLES)
+        self.assertEqual(db.find_query('insert_result'),
+                         queries['insert_result'])
+        with self.assertRaises(QueryNotFound):
+            db.find_query('missing')
+
+    def test_prepare_query(self):
+        self.assertEqual(
+            prepare_query('UPDATE t SET a = %s WHERE b = %s;\n'),
+            'UPDATE t SET a = $1 WHERE b = $2')
+        self.assertEqual(prepare_query('SELECT 1'), 'SELECT 1')
+        prepared = prepare_query(get_queries(TABLES)['select_intersect'])
+        self.assertIn('ST_3DIntersects($1, geom)', prepared)
+        self.assertIn('ST_3DDistance($2, geom)', prepared)
+
+
+    def test_prepared(self):
+        statements = []
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def execute(self, q, args=None):
+                statements.append(q)
+
+        class Connection:
+            connection = object()
+
+            def cursor(self):
+                return Cursor()
+
+            def close(self):
+                self.connection = object()
+
+        conn = Connection()
+        with mock.patch.object(store, 'connections', {'default': conn}):
+            db = Data('default', TABLES, prepared=['insert_result'])
+            db.exec('insert_result', (1, 2, 3, 4, 5, 6, 7))
+            db.exec('insert_result', (1, 2, 3, 4, 5, 6, 7))
+            db.exec('drop_result')
+            self.assertEqual(db.total_exec(), 3)
+            Data('default', TABLES, reset=True, prepared=['insert_result'])\
+                .exec('insert_result', (1, 2, 3, 4, 5, 6, 7))
+
+        self.assertEqual(
+            [q.split()[0] for q in statements],
+            ['PREPARE', 'EXECUTE', 'EXECUTE', 'DROP', 'PREPARE', 'EXECUTE'])
+        self.assertEqual(statements[1],
+                         'EXECUTE solar_insert_result({})'.format(
+                             ', '.join(['%s'] * 7)))
+
+    def test_replica_failures(self):
+        if not settings.configured:
+            settings.configure()
+        # nothing listens on port 1
+        database = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': 'solar',
+            'HOST': '127.0.0.1',
+            'PORT': '1',
+        }
+        handler = ConnectionHandler({'default': database, 'dead': database})
+        store.use_balancer('least', eject_failures=2, eject_time=60)
+        try:
+            with mock.patch.object(store, 'connections', handler):
+                db = Data('dead', TABLES)
+                for _ in range(2):
+                    with self.assertRaises(OperationalError):
+                        db.exec('drop_result')
+            stats = store.balancer_stats()['dead']
+            self.assertEqual(stats['failures'], 2)
+            self.assertTrue(stats['ejected'])
+        finally:
+            store.use_balancer('random')
+
+    def test_rows_errors(self):
+        pool = ConnectionPool('default', mock.MagicMock, 1, timeout=0.01)
+        db = Data('default', TABLES)
+        with mock.patch.object(store, 'get_pool', return_value=pool), \
+                pool.connection():
+            # a busy pool is not an empty result
+            with self.assertRaises(PoolTimeout):
+                list(db.rows('select_roof', {}, (1, )))
+
+
+if __name__ == '__main__':
+    unittest.main()
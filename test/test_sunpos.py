@@ -1,8 +1,9 @@
 import unittest
-from solar_loader import sunpos
+from solar_loader import ephemeris, sunpos
+from solar_loader.geom import unit_vector
 import numpy as np
 from pysolar import solar
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pkg_resources import get_distribution, parse_version
 
 class TestSunPos(unittest.TestCase):
@@ -63,6 +64,85 @@ class TestSunPos(unittest.TestCase):
             self.assertTrue(azim > az_min)
             self.assertTrue(azim < az_max)
 
+    def test_ephemeris_against_pysolar(self):
+        bxl_lon = 4.3528
+        bxl_lat = 50.8466
+        rng = np.random.RandomState(0)
+        start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+        times = [start + timedelta(seconds=s)
+                 for s in rng.uniform(0, 20 * 365 * 86400, 200)]
+
+        angles = ephemeris.sun_angles(times, bxl_lat, bxl_lon, 13)
+
+        for i, t in enumerate(times):
+            altitude = solar.get_altitude(bxl_lat, bxl_lon, t, 13)
+            if altitude < 0:
+                continue
+            azimuth = solar.get_azimuth(bxl_lat, bxl_lon, t, 13)
+            self.assertAlmostEqual(angles.altitude[i], altitude,
+                                   delta=ephemeris.TOLERANCE)
+            self.assertAlmostEqual(
+                (angles.azimuth[i] - azimuth + 180) % 360 - 180, 0,
+                delta=ephemeris.TOLERANCE)
+            self.assertAlmostEqual(angles.sza[i], 90 - angles.altitude[i])
+            self.assertAlmostEqual(angles.saa[i], angles.azimuth[i] - 180)
+            self.assertAlmostEqual(np.linalg.norm(angles.vectors[i]), 1)
+
+    def test_ephemeris_places(self):
+        times = np.arange('2017-06-21T04', '2017-06-21T20',
+                          np.timedelta64(1, 'h'), dtype='datetime64[s]')
+        lats = np.array([[50.0], [51.0]])
+        lons = np.array([[3.0], [5.0]])
+
+        angles = ephemeris.sun_angles(times, lats, lons)
+
+        self.assertEqual(angles.azimuth.shape, (2, len(times)))
+        self.assertEqual(angles.vectors.shape, (2, len(times), 3))
+        for i in range(2):
+            single = ephemeris.sun_angles(times, lats[i, 0], lons[i, 0])
+            np.testing.assert_allclose(angles.altitude[i], single.altitude)
+
+    def test_l72_to_wgs(self):
+        points = np.array([[150000.0, 170000.0, 30.0],
+                           [160000.0, 170000.0, 30.0]])
+        lons, lats, heights = sunpos.l72_to_wgs(points)
+        self.assertEqual(lons.shape, (2, ))
+        for i, point in enumerate(points):
+            lon, lat, height = sunpos.l72_to_wgs(point)
+            self.assertAlmostEqual(lon, lons[i])
+            self.assertAlmostEqual(lat, lats[i])
+        # Brussels
+        self.assertAlmostEqual(lons[0], 4.3688, places=3)
+        self.assertAlmostEqual(lats[0], 50.8404, places=3)
+        self.assertIs(sunpos.get_transformer(), sunpos.get_transformer())
+
+    def test_sun_cache(self):
+        calls = []
+
+        def positions(point, times):
+            calls.append((point, times))
+            return sunpos.get_sun_positions(point, times)
+
+        cache = sunpos.SunCache(100, 0, positions)
+        start = datetime(2017, 6, 21, tzinfo=timezone.utc)
+        times = [start + timedelta(hours=h) for h in range(24)]
+        point = np.array([150010.0, 170020.0, 30.0])
+
+        first = cache.get(point, times)
+        second = cache.get(point + [50, 50, 0], times)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+        for (lit, vec), (lit2, vec2), expected in zip(
+                first, second, sunpos.get_sun_positions(point, times)):
+            self.assertEqual(lit, expected.is_daylight)
+            self.assertIs(vec2, vec)
+            if lit:
+                np.testing.assert_allclose(
+                    vec, unit_vector(expected.coords - point), atol=1e-4)
+
+        cache.get(point + [100, 0, 0], times[:2])
+        self.assertEqual(len(calls), 2)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+import numpy as np
+from solar_loader.time import hours_for_year
+from solar_loader.tmy import TMY
+from test_cube import write_tmy
+
+
+class TestTMY(unittest.TestCase):
+    def test_get_float_average(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmy_path = Path(tmp).joinpath('tmy.csv').as_posix()
+            write_tmy(tmy_path)
+            tmy = TMY(tmy_path)
+            self.assertEqual(len(tmy), 8760)
+
+        sample_rate = 14
+        # around the switch to summer time, and hours off the hour
+        times = list(hours_for_year(2018))[1900:2200:7]
+        times += [t + timedelta(minutes=50) for t in times]
+        for t in times:
+            days = range(-(sample_rate // 2), sample_rate - sample_rate // 2)
+            expected = np.mean([
+                tmy.get_float('G_Gh', t + timedelta(days=d)) for d in days
+            ])
+            self.assertAlmostEqual(
+                tmy.get_float_average('G_Gh', t, sample_rate), expected)
+
+        np.testing.assert_allclose(
+            tmy.get_float_averages('G_Gh', times, sample_rate),
+            [tmy.get_float_average('G_Gh', t, sample_rate) for t in times])
+        # the first hours of a local year are in the UTC year before
+        year = list(hours_for_year(2019))
+        times = year[:30] + year[-30:]
+        np.testing.assert_allclose(
+            tmy.get_float_averages('G_Gh', times, sample_rate),
+            [tmy.get_float_average('G_Gh', t, sample_rate) for t in times])
+        index = tmy.get_indices(times)
+        np.testing.assert_array_equal(
+            tmy.get_floats('hs', index),
+            [tmy.get_float('hs', t) for t in times])
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmy_path = Path(tmp).joinpath('tmy.csv')
+            cache_path = Path(tmp).joinpath('tmy.npy')
+            write_tmy(tmy_path.as_posix())
+            t = list(hours_for_year(2018))[4000]
+
+            tmy = TMY(tmy_path.as_posix(), cache_path.as_posix())
+            self.assertFalse(cache_path.exists())
+            hs = tmy.get_float('hs', t)
+            self.assertTrue(cache_path.exists())
+
+            cached = TMY(tmy_path.as_posix(), cache_path.as_posix())
+            self.assertEqual(cached.get_float('hs', t), hs)
+            self.assertIsInstance(cached.columns['hs'], np.memmap)
+
+            # a changed file is read again
+            tmy_path.write_text(
+                tmy_path.read_text().replace(',10\n', ',11\n'))
+            changed = TMY(tmy_path.as_posix(), cache_path.as_posix())
+            self.assertEqual(changed.get_float('Ta', t), 11)
+            self.assertNotIsInstance(changed.columns['Ta'], np.memmap)
+
+
+if __name__ == '__main__':
+    unittest.main()